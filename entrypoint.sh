@@ -1,4 +1,38 @@
 #!/bin/sh
-python ./manage.py migrate
-python ./manage.py loaddata /app/data/polls-v4.json /app/data/votes-v4.json /app/data/users.json
-python ./manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+# Usage: entrypoint.sh [init|serve|serve-asgi|dev]
+#   init        one-shot step: migrate, create cache tables, load fixtures,
+#               rebuild vote counters
+#   serve       production WSGI server (gunicorn, see gunicorn.conf.py)
+#   serve-asgi  production ASGI server (uvicorn with WEB_CONCURRENCY workers),
+#               with the async read views unless POLLS_ASYNC_VIEWS=False
+#   dev         init then the Django development server
+set -e
+
+init() {
+    python ./manage.py migrate --noinput
+    # table of the results cache when RESULTS_CACHE_BACKEND=db, no-op otherwise
+    python ./manage.py createcachetable
+    python ./manage.py loaddata /app/data/polls-v4.json /app/data/votes-v4.json /app/data/users.json
+    python ./manage.py sync_vote_counts
+}
+
+case "${1:-serve}" in
+    init)
+        init
+        ;;
+    serve)
+        exec gunicorn --config gunicorn.conf.py mysite.wsgi:application
+        ;;
+    serve-asgi)
+        export POLLS_ASYNC_VIEWS="${POLLS_ASYNC_VIEWS:-True}"
+        exec uvicorn mysite.asgi:application --host 0.0.0.0 --port 8000 \
+            --workers "${WEB_CONCURRENCY:-2}" --no-access-log
+        ;;
+    dev)
+        init
+        exec python ./manage.py runserver 0.0.0.0:8000
+        ;;
+    *)
+        exec "$@"
+        ;;
+esac
@@ -0,0 +1,21 @@
+"""Gunicorn configuration for serving ku-polls in production.
+
+Worker and thread counts come from the environment:
+WEB_CONCURRENCY (worker processes) and GUNICORN_THREADS (threads per worker).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# more than one thread switch gunicorn to the threaded (gthread) worker
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+keepalive = 5
+# recycle workers now and then to bound memory growth
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = max_requests // 10
+# load the application once in the master before forking workers
+preload_app = True
+# an empty GUNICORN_ACCESSLOG turn the access log off
+accesslog = os.environ.get("GUNICORN_ACCESSLOG", "-") or None
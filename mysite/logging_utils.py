@@ -0,0 +1,123 @@
+"""Logging helpers: JSON records, DEBUG sampling and a non-blocking queue handler."""
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+# attributes every LogRecord has, anything else was passed with extra=
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one JSON object per line.
+
+    Values passed with extra= are added as fields of the object.
+    """
+
+    def format(self, record):
+        """Return the record as a JSON string."""
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep every INFO and higher record but only a sample of DEBUG records."""
+
+    def __init__(self, rate=1.0, name=""):
+        """Keep DEBUG records with probability rate (0 to 1)."""
+        super().__init__(name)
+        self.rate = rate
+
+    def filter(self, record):
+        """Return whether the record is logged."""
+        if record.levelno > logging.DEBUG:
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class QueueListenerHandler(QueueHandler):
+    """Put records on a bounded queue written by a background thread.
+
+    The request thread only formats the message and enqueues it, the
+    target handlers (e.g. the log file) are called by a QueueListener
+    thread. When the queue is full records are dropped and counted
+    instead of blocking the request.
+
+    The listener starts on the first record of each process, so it also
+    works in gunicorn workers forked from a preloaded master.
+    """
+
+    def __init__(self, handlers, queue_size=10000, respect_handler_level=True):
+        """Keep the handlers records are forwarded to.
+
+        In LOGGING they are given as "cfg://handlers.<name>" references,
+        which dictConfig resolves to handlers it has already configured.
+        It configures handlers in name order, so targets must be named
+        before the queue handler.
+        """
+        super().__init__(queue.Queue(maxsize=queue_size))
+        # indexing resolves the references of a dictConfig list.
+        self.target_handlers = [handlers[index] for index in range(len(handlers))]
+        for target in self.target_handlers:
+            if not isinstance(target, logging.Handler):
+                raise ValueError(f"Target handler {target!r} is not configured yet")
+        self.queue_size = queue_size
+        self.respect_handler_level = respect_handler_level
+        self.listener = None
+        self.dropped = 0
+        self._pid = None
+
+    def _start_listener(self):
+        """Start a listener thread for this process."""
+        if self._pid is not None:
+            # forked process: the parent's queue and thread are not ours.
+            self.queue = queue.Queue(maxsize=self.queue_size)
+        self.listener = QueueListener(self.queue, *self.target_handlers,
+                                      respect_handler_level=self.respect_handler_level)
+        self.listener.start()
+        self._pid = os.getpid()
+        atexit.register(self.flush_and_stop)
+
+    def emit(self, record):
+        """Start the listener if needed and enqueue the record."""
+        if self._pid != os.getpid():
+            self.acquire()
+            try:
+                if self._pid != os.getpid():
+                    self._start_listener()
+            finally:
+                self.release()
+        super().emit(record)
+
+    def enqueue(self, record):
+        """Enqueue without waiting, drop the record if the queue is full."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush_and_stop(self):
+        """Write out queued records and stop the listener thread."""
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self._pid = None
+
+    def close(self):
+        """Stop the listener before closing the handler."""
+        self.flush_and_stop()
+        super().close()
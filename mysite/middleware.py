@@ -0,0 +1,39 @@
+"""Middleware of the mysite project."""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise middleware that can also run in an async middleware chain.
+
+    WhiteNoise 6 is sync only, so under ASGI Django would run it, and
+    every middleware and view after it, in a thread. Here static files
+    are still served from a thread, other requests go on to the next
+    middleware without leaving the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        """Mark the middleware as a coroutine when the next handler is one."""
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        """Serve a static file or pass the request on."""
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        """Serve a static file from a thread, or await the next handler."""
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,75 @@
+"""Test runner reporting the wall-clock time of the suite and its slowest tests."""
+import json
+import time
+import unittest
+
+from django.test.runner import DiscoverRunner, ParallelTestSuite
+
+
+class TimedTextTestResult(unittest.TextTestResult):
+    """Text result keeping the duration of each test."""
+
+    def __init__(self, *args, **kwargs):
+        """Start with no durations."""
+        super().__init__(*args, **kwargs)
+        self.durations = {}
+        self._started = None
+
+    def startTest(self, test):
+        """Start the clock of a test."""
+        self._started = time.perf_counter()
+        super().startTest(test)
+
+    def stopTest(self, test):
+        """Record how long a test took."""
+        super().stopTest(test)
+        self.durations[test.id()] = time.perf_counter() - self._started
+
+
+class TimedTestRunner(DiscoverRunner):
+    """DiscoverRunner printing wall-clock time and the slowest tests.
+
+    Durations of single tests are only known when the tests run in
+    this process, with --parallel the total time is reported.
+    """
+
+    def __init__(self, slowest=10, timing_report=None, **kwargs):
+        """Keep the number of slow tests to show and the report path."""
+        super().__init__(**kwargs)
+        self.slowest = slowest
+        self.timing_report = timing_report
+
+    @classmethod
+    def add_arguments(cls, parser):
+        """Add the timing options."""
+        super().add_arguments(parser)
+        parser.add_argument("--slowest", type=int, default=10,
+                            help="Number of slowest tests to list (0 for none).")
+        parser.add_argument("--timing-report",
+                            help="Write the suite time and test durations to this JSON file.")
+
+    def get_resultclass(self):
+        """Use the timed result unless a debugging result is asked for."""
+        return super().get_resultclass() or TimedTextTestResult
+
+    def run_suite(self, suite, **kwargs):
+        """Run the suite and report its wall-clock time."""
+        started = time.perf_counter()
+        result = super().run_suite(suite, **kwargs)
+        elapsed = time.perf_counter() - started
+        processes = suite.processes if isinstance(suite, ParallelTestSuite) else 1
+        # a parallel run replay results of other processes, not their durations
+        durations = getattr(result, "durations", {}) if processes == 1 else {}
+        self.log(f"Ran {result.testsRun} tests in {elapsed:.2f}s wall clock "
+                 f"with {processes} process{'es' if processes > 1 else ''}.")
+        slowest = sorted(durations.items(), key=lambda item: item[1], reverse=True)[:self.slowest]
+        for test_id, duration in slowest:
+            self.log(f"{duration:8.3f}s  {test_id}")
+        if self.timing_report:
+            with open(self.timing_report, "w") as report:
+                json.dump({"tests": result.testsRun, "processes": processes,
+                           "wall_seconds": round(elapsed, 3),
+                           "durations": {test_id: round(duration, 4)
+                                         for test_id, duration in sorted(durations.items())}},
+                          report, indent=2)
+        return result
@@ -0,0 +1,32 @@
+"""Settings of the test suite, used by "manage.py test".
+
+Tests hash passwords with MD5, keep every cache in the process, write
+votes synchronously and only log warnings to the console, so test
+processes started by --parallel share nothing but the database server.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES, LOGGING
+
+# fast, insecure hashing, only for test users
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+CACHES["results"] = {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    "LOCATION": "polls_results_cache",
+    "TIMEOUT": 300,
+}
+
+# one process, so the locmem sessions cache is safe to read sessions from
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
+# buffered votes are flushed by the tests themselves
+POLLS_VOTE_FLUSH_INTERVAL = 0
+# results JSON and streams read the tallies on every request
+POLLS_RESULTS_STREAM_INTERVAL = 0
+
+LOGGING["handlers"] = {"console": {"level": "WARNING", "class": "logging.StreamHandler"}}
+for logger in LOGGING["loggers"].values():
+    logger["handlers"] = ["console"]
+    logger["level"] = "WARNING"
+
+TEST_RUNNER = "mysite.test_runner.TimedTestRunner"
@@ -1,7 +1,11 @@
 """Module for admin."""
 from django.contrib import admin
+from django.db.models import BooleanField, ExpressionWrapper, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
-from .models import Choice, Question
+from .models import Choice, Question, Vote
+from .pagination import EstimatedCountPaginator
 
 
 class ChoiceInline(admin.TabularInline):
@@ -9,17 +13,107 @@ class ChoiceInline(admin.TabularInline):
 
     model = Choice
     extra = 3
+    fields = ["choice_text", "vote_count"]
+    readonly_fields = ["vote_count"]
+    ordering = ["id"]
+
+
+class StatusListFilter(admin.SimpleListFilter):
+    """Filter questions by the status annotated in QuestionAdmin.get_queryset."""
+
+    title = "status"
+    parameter_name = "status"
+
+    def lookups(self, request, model_admin):
+        """Return the statuses to filter on."""
+        return [("open", "Open"), ("ended", "Ended"), ("scheduled", "Not published yet")]
+
+    def queryset(self, request, queryset):
+        """Keep the questions of the selected status."""
+        if self.value() == "open":
+            return queryset.filter(is_open=True)
+        if self.value() == "ended":
+            return queryset.filter(published=True, is_open=False)
+        if self.value() == "scheduled":
+            return queryset.filter(published=False)
+        return queryset
 
 
 class QuestionAdmin(admin.ModelAdmin):
-    """Admin user can create a question and choice from admin page and also set published and end date."""
+    """Admin user can create a question and choice from admin page and also set published and end date.
+
+    Status and vote totals are computed in SQL for the rows of the
+    page, and large tables are paginated with an estimated count.
+    """
 
     fieldsets = [
         (None, {"fields": ["question_text"]}),
         ("Date information", {"fields": ["pub_date", "end_date"], "classes": ["collapse"]}),
     ]
     inlines = [ChoiceInline]
-    list_display = ["question_text", "pub_date", "end_date", "is_published", "can_vote"]
+    list_display = ["question_text", "pub_date", "end_date", "is_published", "can_vote", "total_votes"]
+    search_fields = ["question_text"]
+    # date_hierarchy would list the distinct dates of the whole table
+    list_filter = [StatusListFilter, ("pub_date", admin.DateFieldListFilter)]
+    ordering = ["-pub_date", "-id"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """Annotate published and open status and the vote total of each question."""
+        now = timezone.now()
+        totals = (Choice.objects.filter(question=OuterRef("pk")).order_by()
+                  .values("question").annotate(total=Sum("vote_count")).values("total"))
+        return super().get_queryset(request).annotate(
+            published=ExpressionWrapper(Q(pub_date__lte=now), output_field=BooleanField()),
+            is_open=ExpressionWrapper(
+                Q(pub_date__lte=now) & (Q(end_date__isnull=True) | Q(end_date__gte=now)),
+                output_field=BooleanField()),
+            vote_total=Coalesce(Subquery(totals), 0),
+        )
+
+    @admin.display(boolean=True, ordering="published", description="Published")
+    def is_published(self, question):
+        """Return the published status computed by the query."""
+        return question.published
+
+    @admin.display(boolean=True, ordering="is_open", description="Can vote")
+    def can_vote(self, question):
+        """Return the open status computed by the query."""
+        return question.is_open
+
+    @admin.display(ordering="vote_total", description="Votes")
+    def total_votes(self, question):
+        """Return the sum of the vote counters of the question's choices."""
+        return question.vote_total
+
+
+class VoteAdmin(admin.ModelAdmin):
+    """List of votes that can be deleted but not added or changed.
+
+    Deletion stays allowed, so deleting a question, choice or user
+    deletes its votes too, and a deleted vote leaves its choice
+    counter through the post_delete signal. Related objects are shown
+    by id and looked up with the rows of the page, so no user or choice
+    list is ever loaded.
+    """
+
+    list_display = ["id", "user", "question", "choice"]
+    list_select_related = ["user", "question", "choice"]
+    raw_id_fields = ["user", "question", "choice"]
+    search_fields = ["=user__username"]
+    ordering = ["-id"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        """Votes are only cast through the polls."""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """Votes are only changed through the polls."""
+        return False
 
 
 admin.site.register(Question, QuestionAdmin)
+admin.site.register(Vote, VoteAdmin)
@@ -0,0 +1,231 @@
+"""JSON results endpoint and live results stream.
+
+Results are versioned by a digest of the tallies read from the
+database, so every worker of a deployment gives the same version for
+the same votes, whatever its cache holds. Each process reads the
+tallies of a question at most once per POLLS_RESULTS_STREAM_INTERVAL
+and shares them between all its JSON requests and streams, so the
+database load does not grow with the number of watchers.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from .models import Question
+from .results import get_results, with_percentages
+
+
+def results_version(results):
+    """Return the version of results, a digest of the question text and tallies."""
+    content = json.dumps([results["question_text"], results["final"],
+                          [(choice["id"], choice["choice_text"], choice["votes"])
+                           for choice in results["choices"]]])
+    return hashlib.md5(content.encode()).hexdigest()[:16]
+
+
+class ResultsPoller:
+    """Latest results of each question in this process, read at most once per interval.
+
+    A thread reading a question makes the others asking for it wait and
+    take its read, instead of querying too.
+    """
+
+    def __init__(self):
+        """Start with no results read."""
+        self.lock = threading.Lock()
+        self.question_locks = {}
+        self.latest = {}
+
+    def fresh(self, question_id):
+        """Return (version, results) read less than an interval ago, or None."""
+        entry = self.latest.get(question_id)
+        if entry is None or time.monotonic() - entry[0] >= settings.POLLS_RESULTS_STREAM_INTERVAL:
+            return None
+        return entry[1], entry[2]
+
+    def state(self, question_id):
+        """Return (version, results) of a question, read from the database once per interval.
+
+        Raises:
+            Question.DoesNotExist: if there is no question with this id.
+        """
+        state = self.fresh(question_id)
+        if state is not None:
+            return state
+        with self.lock:
+            question_lock = self.question_locks.setdefault(question_id, threading.Lock())
+        with question_lock:
+            # read by another thread while this one waited.
+            state = self.fresh(question_id)
+            if state is not None:
+                return state
+            try:
+                results = get_results(question_id)
+            except Question.DoesNotExist:
+                self.latest.pop(question_id, None)
+                raise
+            state = results_version(results), results
+            self.latest[question_id] = (time.monotonic(), *state)
+        return state
+
+    def clear(self):
+        """Forget every question read."""
+        with self.lock:
+            self.latest.clear()
+
+
+results_poller = ResultsPoller()
+
+
+def results_state(question_id):
+    """Return (version, results) of a question, shared by the requests of this process.
+
+    Raises:
+        Question.DoesNotExist: if there is no question with this id.
+    """
+    return results_poller.state(question_id)
+
+
+async def aresults_state(question_id):
+    """Return (version, results) of a question like results_state, from async code.
+
+    Raises:
+        Question.DoesNotExist: if there is no question with this id.
+    """
+    return await sync_to_async(results_poller.state)(question_id)
+
+
+def results_etag(question_id, version):
+    """Return the ETag of a version of a question's results."""
+    return quote_etag(f"results-{question_id}-{version}")
+
+
+def tally_changes(old, new):
+    """Return the choices of new whose votes differ from old.
+
+    Args:
+        old : dict of choice id to votes sent before
+        new : dict of choice id to votes now
+    """
+    return {choice_id: votes for choice_id, votes in new.items() if old.get(choice_id) != votes}
+
+
+def results_json(request, pk):
+    """Return the vote tallies of a question as JSON.
+
+    The response has the results version as ETag, a request with
+    If-None-Match of the current version get a 304.
+    """
+    try:
+        version, results = results_state(pk)
+    except Question.DoesNotExist:
+        raise Http404("No Question matches the given query.")
+    return results_response(request, pk, version, results)
+
+
+async def aresults_json(request, pk):
+    """Return the vote tallies of a question as JSON, like results_json, from async code."""
+    try:
+        version, results = await aresults_state(pk)
+    except Question.DoesNotExist:
+        raise Http404("No Question matches the given query.")
+    return results_response(request, pk, version, results)
+
+
+def results_response(request, pk, version, results):
+    """Return the JSON response of a results version, or a 304 if the client has it."""
+    etag = results_etag(pk, version)
+    response = get_conditional_response(request, etag=etag) or JsonResponse({
+        "id": results["id"],
+        "question_text": results["question_text"],
+        "version": version,
+        "total": results["total"],
+        "final": results["final"],
+        "choices": with_percentages(results),
+    })
+    response["ETag"] = etag
+    patch_cache_control(response, max_age=0, must_revalidate=True)
+    return response
+
+
+def sse_event(event, data, event_id=None):
+    """Return a server-sent event as text."""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def tally_events(question_id, interval, duration, heartbeat=15.0):
+    """Yield a results event, then a tallies event for each change.
+
+    The results are checked every interval seconds for duration seconds,
+    from the read shared by the streams of this process. Only choices whose votes changed are sent, as
+    a dict of choice id to votes, with the new total. Final results of
+    a closed poll are sent once.
+    """
+    version, results = await aresults_state(question_id)
+    sent = {str(choice["id"]): choice["votes"] for choice in results["choices"]}
+    yield sse_event("results", {
+        "version": version, "total": results["total"], "final": results["final"],
+        "choices": with_percentages(results)}, event_id=version)
+    if results["final"]:
+        return
+    deadline = time.monotonic() + duration
+    last_write = time.monotonic()
+    while time.monotonic() < deadline:
+        await asyncio.sleep(interval)
+        try:
+            current, results = await aresults_state(question_id)
+        except Question.DoesNotExist:
+            yield sse_event("deleted", {"version": version})
+            return
+        if current != version:
+            version = current
+            tallies = {str(choice["id"]): choice["votes"] for choice in results["choices"]}
+            changes = tally_changes(sent, tallies)
+            removed = [choice_id for choice_id in sent if choice_id not in tallies]
+            sent = tallies
+            if changes or removed:
+                yield sse_event("tallies", {"version": version, "total": results["total"],
+                                            "changed": changes, "removed": removed},
+                                event_id=version)
+                last_write = time.monotonic()
+                continue
+        if time.monotonic() - last_write >= heartbeat:
+            # comment line keeping proxies from closing an idle stream.
+            yield ": keep-alive\n\n"
+            last_write = time.monotonic()
+
+
+async def results_stream(request, pk):
+    """Stream results changes of a question as server-sent events.
+
+    The stream closes after POLLS_RESULTS_STREAM_SECONDS, browsers'
+    EventSource reconnect on their own. It needs an ASGI server
+    (entrypoint.sh serve-asgi): a WSGI server would read the whole
+    stream before sending it, so it is refused with a 501.
+    """
+    if isinstance(request, WSGIRequest):
+        return HttpResponse("The results stream needs an ASGI server.", status=501,
+                            content_type="text/plain")
+    if not await Question.objects.filter(pk=pk).aexists():
+        raise Http404("No Question matches the given query.")
+    response = StreamingHttpResponse(
+        tally_events(pk, settings.POLLS_RESULTS_STREAM_INTERVAL,
+                     settings.POLLS_RESULTS_STREAM_SECONDS),
+        content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # tell nginx not to buffer the stream.
+    response["X-Accel-Buffering"] = "no"
+    return response
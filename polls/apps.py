@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class PollsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'polls'
+
+    def ready(self):
+        # connect the receivers invalidating cached results and poll states,
+        # also in processes that never load the URLconf (commands, shell).
+        from . import cache, state  # noqa: F401
+        # instrument database connections from the first one opened.
+        from . import timing  # noqa: F401
@@ -0,0 +1,76 @@
+"""Archival of the votes of long closed polls into the ArchivedVote table.
+
+Votes are moved one chunk at a time, each chunk in its own short
+transaction, so the site keeps running while a large archive runs and
+an interrupted run is resumed by running it again. Moved votes are
+deleted without the post_delete signal, so the choice counters, the
+results snapshot and the cached results keep counting them.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import ArchivedVote, Question, ResultsSnapshot, Vote
+from .snapshots import delete_votes, take_snapshot
+
+
+def archivable_questions(older_than=30, now=None):
+    """Return questions that ended more than older_than days ago and still have votes."""
+    now = now or timezone.now()
+    cutoff = now - datetime.timedelta(days=older_than)
+    return (Question.objects.filter(end_date__lte=cutoff)
+            .filter(Exists(Vote.objects.filter(question=OuterRef("pk"))))
+            .order_by("end_date", "id"))
+
+
+def move_votes(question_id, chunk_size=2000):
+    """Move the next chunk of votes of a question to the archive.
+
+    Returns:
+        number of votes moved, 0 once the question has no votes left
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(Vote.objects.filter(question_id=question_id).order_by("id")
+                    .values_list("id", "user_id", "choice_id")[:chunk_size])
+        if not rows:
+            return 0
+        ArchivedVote.objects.bulk_create(
+            [ArchivedVote(id=vote_id, user_id=user_id, question_id=question_id,
+                          choice_id=choice_id, archived_at=now)
+             for vote_id, user_id, choice_id in rows],
+            ignore_conflicts=True)
+        # no post_delete: the counters keep the archived votes.
+        delete_votes(f"id IN ({', '.join(['%s'] * len(rows))})", [row[0] for row in rows])
+    return len(rows)
+
+
+def archive_question(question, chunk_size=2000, progress=None):
+    """Snapshot a closed question if needed, then move all its votes to the archive.
+
+    The snapshot is marked as archived like the one of a file archive.
+
+    Args:
+        question : Question that has ended
+        chunk_size : votes moved per transaction
+        progress : callable receiving the question and votes moved after each chunk
+
+    Returns:
+        number of votes moved
+    """
+    snapshot = ResultsSnapshot.objects.filter(question=question).first() or take_snapshot(question)
+    if snapshot.votes_archived_at is None:
+        # marked before the first chunk, so reopening the poll keeps the snapshot.
+        snapshot.votes_archived_at = timezone.now()
+        snapshot.save(update_fields=["votes_archived_at"])
+    total = 0
+    while True:
+        moved = move_votes(question.id, chunk_size)
+        total += moved
+        if moved and progress:
+            progress(question, total)
+        if moved < chunk_size:
+            # a short chunk was the last one.
+            return total
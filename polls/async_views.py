@@ -0,0 +1,91 @@
+"""Async versions of the index, detail and results pages.
+
+They render the same templates as IndexView, DetailView and
+ResultsView, reading with the async ORM and the async cache API, so
+under an ASGI server a request waiting on the database or the cache
+does not hold a thread. They are routed instead of the sync views when
+POLLS_ASYNC_VIEWS is set. Voting stays a sync view, run in a thread
+with its transaction.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.http import Http404
+from django.shortcuts import redirect, render
+
+from .cache import acached_results, apage_version, results_cache
+from .ingest import vote_buffer
+from .models import Question, Vote
+from .pagecache import anonymous_page_cache, index_timeout
+from .pagination import KeysetPaginator
+from .results import with_percentages
+from .views import published_questions, published_with_choices
+
+logger = logging.getLogger(__name__)
+
+
+@anonymous_page_cache(lambda kwargs: "index", timeout=index_timeout)
+async def index(request):
+    """Show one keyset page of the published polls, like IndexView."""
+    paginator = KeysetPaginator(published_questions(), settings.POLLS_INDEX_PAGE_SIZE)
+    try:
+        page = await paginator.apage(after=request.GET.get("after"),
+                                     before=request.GET.get("before"))
+    except ValueError:
+        page = await paginator.apage()
+    return render(request, "polls/index.html", {
+        "latest_question_list": page.object_list,
+        "next_cursor": page.next_cursor,
+        "previous_cursor": page.previous_cursor,
+        "page_version": await apage_version("index"),
+        "fragment_timeout": await sync_to_async(index_timeout)(),
+    })
+
+
+async def detail(request, pk):
+    """Show the voting form of an open poll, like DetailView."""
+    # a loaded user, so the template does not query from the event loop.
+    user = request.user = await request.auser()
+    try:
+        question = await published_with_choices().aget(pk=pk)
+    except Question.DoesNotExist:
+        messages.error(request, "The poll does not exist.")
+        logger.warning("Attempted to access non-existent poll.")
+        return redirect("polls:index")
+
+    if not question.can_vote():
+        messages.error(request, "Voting is not allowed for this question.")
+        logger.warning("Attempted to access a closed poll.")
+        return redirect("polls:index")
+
+    # a buffered vote not written yet comes first.
+    user_vote = None
+    if user.is_authenticated:
+        pending_choice_id = vote_buffer.pending_choice(user.id, question.id)
+        if pending_choice_id is not None:
+            user_vote = Vote(user=user, question=question, choice_id=pending_choice_id)
+        else:
+            user_vote = await Vote.objects.filter(user=user, question=question).afirst()
+
+    return render(request, "polls/detail.html", {
+        "question": question,
+        "previous_vote": user_vote,
+    })
+
+
+@anonymous_page_cache(lambda kwargs: f"results:{kwargs['pk']}")
+async def results(request, pk):
+    """Show the vote totals of a poll, like ResultsView."""
+    try:
+        question_results = await acached_results(pk)
+    except Question.DoesNotExist:
+        raise Http404("No Question matches the given query.")
+    return render(request, "polls/results.html", {
+        "question": question_results,
+        "choices": with_percentages(question_results),
+        "total_votes": question_results["total"],
+        "page_version": await apage_version(f"results:{pk}"),
+        "fragment_timeout": results_cache().default_timeout,
+    })
@@ -0,0 +1,268 @@
+"""Load test of the ku-polls endpoints with many concurrent clients."""
+import http.cookiejar
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.db import OperationalError, connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .metrics import percentile
+from .seeding import SEED_PASSWORD
+
+SCENARIOS = ("index", "detail", "results", "vote")
+
+
+def summarize(samples, elapsed):
+    """Return latency, throughput and query statistics of samples.
+
+    Args:
+        samples : list of (latency in seconds, queries or None, status code)
+        elapsed : wall clock seconds the samples took
+    """
+    latencies = [latency * 1000 for latency, _, _ in samples]
+    queries = [count for _, count, _ in samples if count is not None]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, _, status in samples if status >= 400),
+        "requests_per_second": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+class ClientTarget:
+    """Send requests in-process through the Django test client.
+
+    Queries of each request are counted on the thread's connection.
+    """
+
+    def __init__(self, user=None, host="localhost"):
+        """Create a client, logged in as user if one is given.
+
+        Server errors are returned as 500 responses and counted as errors.
+        A login still failing after the last attempt is raised, an
+        anonymous client would count login redirects as successes.
+        """
+        self.client = Client(HTTP_HOST=host, raise_request_exception=False)
+        if user is not None:
+            for attempt in range(5):
+                try:
+                    self.client.force_login(user)
+                    break
+                except OperationalError:
+                    if attempt == 4:
+                        raise
+                    # the database is busy with other clients, e.g. locked SQLite.
+                    time.sleep(0.1 * (attempt + 1))
+
+    def request(self, method, path, data=None):
+        """Send a request and return its status code and query count."""
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(path, data or {})
+        return response.status_code, len(context.captured_queries)
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Return redirects as responses instead of following them."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        """Do not follow the redirect."""
+        return None
+
+
+class HttpTarget:
+    """Send requests over HTTP to a running server at base_url.
+
+    Query counts are not visible from outside the server, so they are None.
+    """
+
+    def __init__(self, base_url, user=None):
+        """Create an opener with a cookie jar and log in as user if given."""
+        self.base_url = base_url.rstrip("/")
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect)
+        if user is not None:
+            login_path = reverse("login")
+            self.request("get", login_path)
+            self.request("post", login_path,
+                         {"username": user.username, "password": SEED_PASSWORD})
+
+    def csrf_token(self):
+        """Return the CSRF token cookie set by the server."""
+        for cookie in self.cookies:
+            if cookie.name == "csrftoken":
+                return cookie.value
+        return ""
+
+    def request(self, method, path, data=None):
+        """Send a request and return its status code and None."""
+        url = self.base_url + path
+        body = None
+        headers = {}
+        if method == "post":
+            token = self.csrf_token()
+            body = urllib.parse.urlencode(dict(data or {}, csrfmiddlewaretoken=token)).encode()
+            headers = {"X-CSRFToken": token, "Referer": url}
+        try:
+            with self.opener.open(urllib.request.Request(url, body, headers)) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as error:
+            return error.code, None
+
+
+class ServerSampler:
+    """Sample the memory and threads of a server process while a load runs.
+
+    Reads /proc, so it only works on Linux. Stats are None elsewhere.
+    """
+
+    def __init__(self, pid, interval=0.1):
+        """Sample process pid every interval seconds once started."""
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss_kb = None
+        self.peak_threads = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def sample(self):
+        """Read the resident memory and thread count of the process."""
+        try:
+            with open(f"/proc/{self.pid}/status") as status:
+                fields = dict(line.split(":", 1) for line in status)
+        except OSError:
+            return
+        rss_kb = int(fields["VmRSS"].split()[0])
+        threads = int(fields["Threads"])
+        self.peak_rss_kb = max(self.peak_rss_kb or 0, rss_kb)
+        self.peak_threads = max(self.peak_threads or 0, threads)
+
+    def run(self):
+        """Sample until stopped."""
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        """Start sampling."""
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop sampling."""
+        self.stopped.set()
+        self.thread.join()
+
+    def stats(self):
+        """Return the peak resident memory in MB and peak thread count."""
+        return {
+            "peak_rss_mb": round(self.peak_rss_kb / 1024, 1) if self.peak_rss_kb else None,
+            "peak_threads": self.peak_threads,
+        }
+
+
+def scenario_request(name, question_id, choice_ids, rng):
+    """Return method, path and data of one request of a scenario."""
+    if name == "index":
+        return "get", reverse("polls:index"), None
+    if name == "detail":
+        return "get", reverse("polls:detail", args=(question_id,)), None
+    if name == "results":
+        return "get", reverse("polls:results", args=(question_id,)), None
+    return "post", reverse("polls:vote", args=(question_id,)), {"choice": rng.choice(choice_ids)}
+
+
+def connect(base_url, user, ready):
+    """Return a logged-in target, then wait until every client has one.
+
+    A client failing to log in breaks the barrier, so no client waits
+    for it forever.
+    """
+    try:
+        target = HttpTarget(base_url, user) if base_url else ClientTarget(user)
+    except BaseException:
+        ready.abort()
+        raise
+    ready.wait()
+    return target
+
+
+def run_clients(client_loop, clients, ready, sampler=None):
+    """Run client_loop on clients threads and return the seconds they took.
+
+    The clock starts once every client is logged in, so logins are not
+    counted in the throughput.
+    """
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        futures = [executor.submit(client_loop, number) for number in range(clients)]
+        try:
+            ready.wait()
+        except threading.BrokenBarrierError:
+            # a client failed to start, its future raises the error.
+            pass
+        start = time.perf_counter()
+        with sampler or nullcontext():
+            for future in futures:
+                future.result()
+        return time.perf_counter() - start
+
+
+def run_load(polls, users, scenarios=SCENARIOS, clients=8, requests_per_client=50,
+             base_url=None, seed=0, server_pid=None):
+    """Drive the scenarios with concurrent clients and return the statistics.
+
+    Each client logs in as one of users and sends requests_per_client
+    requests, cycling through scenarios on random polls.
+
+    Args:
+        polls : dict of question id to a list of its choice ids
+        users : users the clients log in as
+        base_url : URL of a running server, or None for the test client
+        server_pid : process id of the server, to report its peak memory and threads
+    """
+    samples = {name: [] for name in scenarios}
+    lock = threading.Lock()
+    question_ids = sorted(polls)
+
+    # clients start sending together once all of them are logged in.
+    ready = threading.Barrier(clients + 1)
+
+    def client_loop(number):
+        rng = random.Random(seed + number)
+        user = users[number % len(users)] if users else None
+        try:
+            target = connect(base_url, user, ready)
+            results = []
+            for count in range(requests_per_client):
+                name = scenarios[count % len(scenarios)]
+                question_id = rng.choice(question_ids)
+                method, path, data = scenario_request(name, question_id, polls[question_id], rng)
+                start = time.perf_counter()
+                status, queries = target.request(method, path, data)
+                results.append((name, (time.perf_counter() - start, queries, status)))
+            with lock:
+                for name, sample in results:
+                    samples[name].append(sample)
+        finally:
+            connections.close_all()
+
+    sampler = ServerSampler(server_pid) if server_pid else None
+    elapsed = run_clients(client_loop, clients, ready, sampler)
+    report = {name: summarize(values, elapsed) for name, values in samples.items()}
+    report["total"] = summarize([sample for values in samples.values() for sample in values], elapsed)
+    report["total"]["seconds"] = round(elapsed, 3)
+    if sampler:
+        report["total"]["server"] = sampler.stats()
+    return report
@@ -0,0 +1,173 @@
+"""Cache of poll results keyed by question id, and page versions."""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ArchivedVote, Choice, Question, Vote
+from .results import aget_results, get_results
+
+RESULTS_CACHE = "results"
+HITS_KEY = "polls:results:hits"
+MISSES_KEY = "polls:results:misses"
+
+
+def results_cache():
+    """Return the cache that holds poll results."""
+    return caches[RESULTS_CACHE]
+
+
+def results_key(question_id):
+    """Return the cache key of a question results."""
+    return f"polls:results:{question_id}"
+
+
+def _count(key):
+    """Add one to a statistic counter of the results cache, if RESULTS_CACHE_STATS is on."""
+    if not settings.RESULTS_CACHE_STATS:
+        return
+    cache = results_cache()
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # counter was evicted between add and incr.
+        cache.set(key, 1, timeout=None)
+
+
+def cached_results(question_id):
+    """Return results of a question, from the cache when possible.
+
+    Final results of a closed poll never change, they are cached
+    without timeout.
+
+    Raises:
+        Question.DoesNotExist: if there is no question with this id.
+    """
+    cache = results_cache()
+    key = results_key(question_id)
+    results = cache.get(key)
+    if results is not None:
+        _count(HITS_KEY)
+        return results
+    _count(MISSES_KEY)
+    results = get_results(question_id)
+    if results["final"]:
+        cache.set(key, results, timeout=None)
+    else:
+        cache.set(key, results)
+    return results
+
+
+async def _acount(key):
+    """Add one to a statistic counter of the results cache, from async code."""
+    if not settings.RESULTS_CACHE_STATS:
+        return
+    cache = results_cache()
+    await cache.aadd(key, 0, timeout=None)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, 1, timeout=None)
+
+
+async def acached_results(question_id):
+    """Return results of a question like cached_results, from async code.
+
+    Raises:
+        Question.DoesNotExist: if there is no question with this id.
+    """
+    cache = results_cache()
+    key = results_key(question_id)
+    results = await cache.aget(key)
+    if results is not None:
+        await _acount(HITS_KEY)
+        return results
+    await _acount(MISSES_KEY)
+    results = await aget_results(question_id)
+    if results["final"]:
+        await cache.aset(key, results, timeout=None)
+    else:
+        await cache.aset(key, results)
+    return results
+
+
+def page_version(scope):
+    """Return the version of cached pages of a scope, e.g. "index" or "results:1"."""
+    cache = results_cache()
+    key = f"polls:version:{scope}"
+    version = cache.get(key)
+    if version is None:
+        # a time based version never repeats one of an evicted counter.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def apage_version(scope):
+    """Return the version of cached pages of a scope, from async code."""
+    cache = results_cache()
+    key = f"polls:version:{scope}"
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def touch_page(scope):
+    """Give cached pages of a scope a new version now and after the commit.
+
+    The first change hides pages right away, the second one pages cached
+    by other requests before the transaction was committed.
+    """
+    def bump():
+        results_cache().set(f"polls:version:{scope}", time.time_ns(), timeout=None)
+    bump()
+    transaction.on_commit(bump)
+
+
+def invalidate_results(question_id):
+    """Drop the cached results and results pages of a question once the transaction commits."""
+    transaction.on_commit(lambda: results_cache().delete(results_key(question_id)))
+    touch_page(f"results:{question_id}")
+
+
+def cache_stats():
+    """Return hit and miss counts of the results cache."""
+    cache = results_cache()
+    return {
+        "hits": cache.get(HITS_KEY, 0),
+        "misses": cache.get(MISSES_KEY, 0),
+    }
+
+
+def reset_cache_stats():
+    """Set hit and miss counts back to zero."""
+    results_cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+@receiver(post_save, sender=Vote)
+@receiver(post_delete, sender=Vote)
+@receiver(post_delete, sender=ArchivedVote)
+def invalidate_on_vote_change(sender, instance, **kwargs):
+    """Invalidate results when a vote is cast, changed or deleted."""
+    invalidate_results(instance.question_id)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def invalidate_on_choice_change(sender, instance, **kwargs):
+    """Invalidate results when a choice of a question change."""
+    invalidate_results(instance.question_id)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_on_question_change(sender, instance, **kwargs):
+    """Invalidate results and index pages when a question is edited or deleted."""
+    invalidate_results(instance.pk)
+    touch_page("index")
@@ -0,0 +1,188 @@
+"""Streaming import of votes from JSON, NDJSON or CSV files.
+
+Files are read one record at a time, so memory does not grow with the
+size of the input. Accepted records are:
+
+- Django fixtures as written by dumpdata, e.g. data/votes-v4.json,
+- rows written by export_results --kind votes, in NDJSON or CSV,
+- any object or CSV row with "choice" or "choice_id" and one of
+  "user", "user_id" or "username".
+"""
+import csv
+import json
+import re
+
+from django.contrib.auth.models import User
+
+from .ingest import write_votes
+from .models import Choice, Vote
+from .seeding import batched
+
+FORMATS = ("json", "ndjson", "csv")
+SKIPPED_WHITESPACE = re.compile(r"[\s,]*")
+
+
+def cut_by_buffer_end(error, buffer):
+    """Return whether a decode error comes from an item cut by the end of the buffer."""
+    if error.msg.startswith("Unterminated string"):
+        # the string runs up to the end of the buffer.
+        return True
+    # a cut literal, number or unicode escape fails a few characters before the end.
+    return error.pos >= len(buffer) - 6
+
+
+def read_json_array(stream, read_size=1 << 16):
+    """Yield the items of a JSON array read incrementally from a text stream.
+
+    More of the stream is only read for an item cut by the end of the
+    buffer, a malformed item fails at once.
+
+    Raises:
+        ValueError: if the stream is not a JSON array.
+    """
+    decoder = json.JSONDecoder()
+    buffer = stream.read(read_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Expected a JSON array.")
+    position = 1
+    eof = False
+    while True:
+        position = SKIPPED_WHITESPACE.match(buffer, position).end()
+        if buffer.startswith("]", position):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+            # a number ending the buffer may go on in the next chunk.
+            cut = end == len(buffer) and not eof
+        except json.JSONDecodeError as error:
+            if eof:
+                raise ValueError("Unexpected end of JSON array.") from None
+            if not cut_by_buffer_end(error, buffer):
+                raise ValueError(f"Invalid JSON array item: {error}") from None
+            cut = True
+        if cut:
+            # item cut by the end of the buffer, read the rest of it.
+            chunk = stream.read(read_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        position = end
+        yield item
+
+
+def read_ndjson(stream):
+    """Yield one object for each non-empty line of a text stream."""
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_records(stream, file_format):
+    """Yield vote records of a text stream, dicts unless the file holds other values.
+
+    Fixture entries are flattened to their fields.
+    """
+    if file_format == "csv":
+        records = csv.DictReader(stream)
+    elif file_format == "ndjson":
+        records = read_ndjson(stream)
+    else:
+        records = read_json_array(stream)
+    for record in records:
+        if isinstance(record, dict) and "fields" in record:
+            record = record["fields"]
+        yield record
+
+
+def guess_format(path):
+    """Return the format of a file from its extension, JSON by default."""
+    for file_format in FORMATS:
+        if path.endswith(f".{file_format}"):
+            return file_format
+    return "json"
+
+
+class VoteImporter:
+    """Write vote records in batches, one vote per user and question.
+
+    Users and choices are resolved through id maps loaded once, so a
+    record costs no query. Each batch is written by ingest.write_votes
+    in one transaction, which also keep the vote counters and cached
+    results correct. A later vote of a user on a question replace the
+    earlier one, unless skip_existing keeps votes already stored.
+    """
+
+    def __init__(self, batch_size=5000, skip_existing=False):
+        """Load the user and choice id maps."""
+        self.batch_size = batch_size
+        self.skip_existing = skip_existing
+        self.user_ids = set()
+        self.usernames = {}
+        for user_id, username in User.objects.values_list("id", "username").iterator(chunk_size=10000):
+            self.user_ids.add(user_id)
+            self.usernames[username] = user_id
+        self.choice_questions = dict(Choice.objects.values_list("id", "question_id")
+                                     .iterator(chunk_size=10000))
+        self.read = 0
+        self.written = 0
+        self.skipped = 0
+        self.replaced = 0
+
+    def resolve(self, record):
+        """Return (user_id, question_id, choice_id) of a record, or None if unknown."""
+        if not isinstance(record, dict):
+            return None
+        try:
+            choice_id = int(record.get("choice_id") or record["choice"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if record.get("username"):
+            user_id = self.usernames.get(record["username"])
+        else:
+            try:
+                user_id = int(record.get("user_id") or record["user"])
+            except (KeyError, TypeError, ValueError):
+                return None
+            if user_id not in self.user_ids:
+                return None
+        question_id = self.choice_questions.get(choice_id)
+        if user_id is None or question_id is None:
+            return None
+        return user_id, question_id, choice_id
+
+    def import_records(self, records, progress=None):
+        """Import records in batches.
+
+        Args:
+            records : iterable of vote dicts
+            progress : callable receiving the importer after each batch
+        """
+        for batch in batched(records, self.batch_size):
+            self.read += len(batch)
+            votes = {}
+            for record in batch:
+                vote = self.resolve(record)
+                if vote is None:
+                    self.skipped += 1
+                    continue
+                if vote[:2] in votes:
+                    # the last vote of a user on a question wins.
+                    self.replaced += 1
+                    del votes[vote[:2]]
+                votes[vote[:2]] = vote
+            if self.skip_existing and votes:
+                self.drop_existing(votes)
+            self.written += write_votes(list(votes.values()))
+            if progress:
+                progress(self)
+
+    def drop_existing(self, votes):
+        """Drop votes of users who already have a stored vote on the question."""
+        user_ids = {user_id for user_id, _ in votes}
+        question_ids = {question_id for _, question_id in votes}
+        existing = (Vote.objects.filter(user_id__in=user_ids, question_id__in=question_ids)
+                    .values_list("user_id", "question_id"))
+        for key in existing:
+            if votes.pop(key, None) is not None:
+                self.replaced += 1
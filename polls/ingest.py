@@ -0,0 +1,272 @@
+"""Buffered vote ingestion with batched writes.
+
+In "buffered" ingestion mode the vote view hands accepted votes to the
+process-wide vote_buffer instead of writing them itself. A background
+thread flushes the buffer every POLLS_VOTE_FLUSH_INTERVAL seconds, or
+sooner when POLLS_VOTE_BATCH_SIZE votes are waiting, with one upsert
+per batch. Until a vote is written, pending_choice() still return it
+so voters see their own vote. The buffer belongs to one process: with
+several workers, a voter whose next request goes to another worker
+does not see a vote still waiting in the first one.
+
+A batch rejected by the database is written again one vote at a time.
+A vote that keeps failing is dropped after POLLS_VOTE_MAX_ATTEMPTS
+flushes and kept in dead_letters, so it cannot hold back the others.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+from django.db.models import Case, F, Value, When
+
+from .cache import invalidate_results
+from .models import Choice, Vote
+
+logger = logging.getLogger(__name__)
+
+
+def lock_voters(user_ids):
+    """Lock the rows of users until the transaction ends, in id order.
+
+    Locking the votes is not enough: a first vote has no row to lock, so
+    two transactions writing it would both count it. Writers holding the
+    user lock read the previous votes one after the other.
+    """
+    list(User.objects.select_for_update().filter(pk__in=user_ids)
+         .order_by("pk").values_list("pk", flat=True))
+
+
+def upsert_votes(votes):
+    """Upsert votes and move the choice counters with them, in one transaction.
+
+    The voters are locked first, then the votes are written with one
+    INSERT ... ON CONFLICT DO UPDATE and the counters of every changed
+    choice with one UPDATE.
+
+    Args:
+        votes : list of (user_id, question_id, choice_id), one per user and question
+
+    Returns:
+        dict of the choice_id each (user_id, question_id) voted before, for votes that existed
+    """
+    if not votes:
+        return {}
+    user_ids = {user_id for user_id, _, _ in votes}
+    question_ids = {question_id for _, question_id, _ in votes}
+    with transaction.atomic():
+        lock_voters(user_ids)
+        existing = {
+            (user_id, question_id): choice_id
+            for user_id, question_id, choice_id in Vote.objects.select_for_update()
+            .filter(user_id__in=user_ids, question_id__in=question_ids)
+            .values_list("user_id", "question_id", "choice_id")
+        }
+        deltas = Counter()
+        for user_id, question_id, choice_id in votes:
+            old_choice_id = existing.get((user_id, question_id))
+            if old_choice_id == choice_id:
+                continue
+            if old_choice_id is not None:
+                deltas[old_choice_id] -= 1
+            deltas[choice_id] += 1
+        Vote.objects.bulk_create(
+            [Vote(user_id=user_id, question_id=question_id, choice_id=choice_id)
+             for user_id, question_id, choice_id in votes],
+            update_conflicts=True, unique_fields=["user", "question"], update_fields=["choice"])
+        deltas = {choice_id: delta for choice_id, delta in deltas.items() if delta}
+        if deltas:
+            Choice.objects.filter(pk__in=deltas).update(vote_count=F("vote_count") + Case(
+                *[When(pk=choice_id, then=Value(delta)) for choice_id, delta in deltas.items()],
+                default=Value(0)))
+        for question_id in question_ids:
+            invalidate_results(question_id)
+    return existing
+
+
+def write_votes(votes):
+    """Upsert a batch of votes and move the choice counters with them.
+
+    Args:
+        votes : list of (user_id, question_id, choice_id), one per user and question
+
+    Returns:
+        the number of votes written.
+    """
+    upsert_votes(votes)
+    return len(votes)
+
+
+class VoteBuffer:
+    """Bounded in-process buffer of votes waiting to be written.
+
+    A user voting again on the same question before the flush only
+    replace the pending choice, so each batch has one vote per user
+    and question.
+    """
+
+    def __init__(self):
+        """Create an empty buffer, the flusher thread start with the first vote."""
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = {}
+        self.received = {}
+        self.thread = None
+        self._pid = None
+        self.submitted = 0
+        self.rejected = 0
+        self.written = 0
+        self.batches = 0
+        self.max_latency = 0.0
+        self.attempts = {}
+        self.dead_lettered = 0
+        self.dead_letters = deque(maxlen=1000)
+
+    def submit(self, user_id, question_id, choice_id):
+        """Add a vote to the buffer.
+
+        Returns:
+            False if the buffer is full and the vote must be written directly.
+        """
+        with self.lock:
+            key = (user_id, question_id)
+            if key not in self.pending and len(self.pending) >= settings.POLLS_VOTE_QUEUE_SIZE:
+                self.rejected += 1
+                return False
+            self.pending[key] = choice_id
+            self.received.setdefault(key, time.monotonic())
+            self.submitted += 1
+            full = len(self.pending) >= settings.POLLS_VOTE_BATCH_SIZE
+        self._ensure_flusher()
+        if full:
+            self.wakeup.set()
+        return True
+
+    def pending_choice(self, user_id, question_id):
+        """Return the choice id of a vote not written yet, or None."""
+        with self.lock:
+            return self.pending.get((user_id, question_id))
+
+    def flush(self):
+        """Write the pending votes in batches.
+
+        A vote stay visible through pending_choice() until its batch
+        is committed. A batch the database rejects is written again one
+        vote at a time, votes that fail are left for the next flush.
+        Errors other than rejected rows, such as a lost connection,
+        stop the flush and keep every vote. Returns the number of votes
+        written.
+        """
+        written = 0
+        failed = set()
+        while True:
+            with self.lock:
+                batch = [item for item in self.pending.items() if item[0] not in failed]
+                batch = batch[:settings.POLLS_VOTE_BATCH_SIZE]
+            if not batch:
+                return written
+            try:
+                write_votes([(user_id, question_id, choice_id)
+                             for (user_id, question_id), choice_id in batch])
+                done = batch
+            except (IntegrityError, DataError):
+                logger.warning("A batch of %s buffered votes was rejected, writing them one by one",
+                               len(batch))
+                done = self._write_one_by_one(batch, failed)
+            self._remove_written(done)
+            written += len(done)
+
+    def _write_one_by_one(self, batch, failed):
+        """Write the votes of a rejected batch alone, return the ones written.
+
+        Keys of the votes that fail are added to failed.
+        """
+        done = []
+        for (user_id, question_id), choice_id in batch:
+            try:
+                write_votes([(user_id, question_id, choice_id)])
+            except (IntegrityError, DataError) as error:
+                failed.add((user_id, question_id))
+                self._vote_failed((user_id, question_id), choice_id, error)
+            else:
+                done.append(((user_id, question_id), choice_id))
+        return done
+
+    def _vote_failed(self, key, choice_id, error):
+        """Count a failed write of a vote, and dead-letter it after the last attempt."""
+        with self.lock:
+            attempts = self.attempts[key] = self.attempts.get(key, 0) + 1
+            if attempts < settings.POLLS_VOTE_MAX_ATTEMPTS or self.pending.get(key) != choice_id:
+                return
+            del self.pending[key]
+            del self.attempts[key]
+            self.received.pop(key)
+            self.dead_lettered += 1
+            self.dead_letters.append({"user_id": key[0], "question_id": key[1],
+                                      "choice_id": choice_id, "error": str(error)})
+        logger.error("Dropped buffered vote of user %s on question %s after %s attempts: %s",
+                     key[0], key[1], attempts, error,
+                     extra={"event": "vote_dead_lettered", "user_id": key[0],
+                            "question_id": key[1], "choice_id": choice_id})
+
+    def _remove_written(self, done):
+        """Take written votes out of the buffer."""
+        now = time.monotonic()
+        with self.lock:
+            for key, choice_id in done:
+                # keep a newer vote that arrived during the write.
+                if self.pending.get(key) == choice_id:
+                    del self.pending[key]
+                    self.attempts.pop(key, None)
+                    received = self.received.pop(key)
+                    self.max_latency = max(self.max_latency, now - received)
+            self.written += len(done)
+            self.batches += 1
+
+    def stats(self):
+        """Return queue depth and counters of the buffer."""
+        with self.lock:
+            oldest = min(self.received.values(), default=None)
+            return {
+                "mode": settings.POLLS_VOTE_INGESTION,
+                "depth": len(self.pending),
+                "oldest_pending_seconds": round(time.monotonic() - oldest, 3) if oldest else 0.0,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "written": self.written,
+                "batches": self.batches,
+                "dead_lettered": self.dead_lettered,
+                "max_flush_latency_seconds": round(self.max_latency, 3),
+            }
+
+    def _ensure_flusher(self):
+        """Start the flusher thread of this process if it is not running."""
+        if settings.POLLS_VOTE_FLUSH_INTERVAL <= 0 or self._pid == os.getpid():
+            return
+        with self.lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name="vote-flusher", daemon=True)
+            self.thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        """Flush the buffer every flush interval or when a batch is full."""
+        while True:
+            self.wakeup.wait(settings.POLLS_VOTE_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                # keep the votes and try again on the next round.
+                logger.exception("Flushing %s buffered votes failed", len(self.pending))
+
+
+vote_buffer = VoteBuffer()
@@ -0,0 +1,44 @@
+"""Command for moving the votes of long closed polls to the archive table."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls.archive import archivable_questions, archive_question
+
+
+class Command(BaseCommand):
+    """Move votes of polls closed for a while from Vote to ArchivedVote.
+
+    Each chunk is moved in its own transaction, so the command can run
+    while the site is up and resumes where it stopped when run again.
+    """
+
+    help = "Move the votes of polls closed more than --older-than days to the archive table."
+
+    def add_arguments(self, parser):
+        """Add archive options."""
+        parser.add_argument("--older-than", type=int, default=30,
+                            help="Days since the end of a poll before its votes are archived.")
+        parser.add_argument("--chunk-size", type=int, default=2000,
+                            help="Votes moved per transaction.")
+        parser.add_argument("--limit", type=int, help="Most polls archived in this run.")
+        parser.add_argument("--pause", type=float, default=0.0,
+                            help="Seconds to wait between polls, to leave room to other writes.")
+
+    def handle(self, *args, **options):
+        """Archive the votes of each poll and report them."""
+        questions = archivable_questions(options["older_than"])
+        if options["limit"]:
+            questions = questions[:options["limit"]]
+        started = time.perf_counter()
+        polls = votes = 0
+        for question in questions.iterator():
+            moved = archive_question(question, options["chunk_size"])
+            polls += 1
+            votes += moved
+            self.stdout.write(f"Question {question.id}: {moved} votes archived")
+            if options["pause"]:
+                time.sleep(options["pause"])
+        seconds = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {votes} votes of {polls} poll(s) in {seconds:.1f}s."))
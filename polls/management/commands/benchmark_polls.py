@@ -0,0 +1,120 @@
+"""Command for load testing the voting flow and saving the results as JSON."""
+import json
+import subprocess
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from polls.benchmark import SCENARIOS, run_load
+from polls.models import Choice, Question
+from polls.seeding import seed_polls
+
+
+def current_commit():
+    """Return the git commit of the working tree, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    """Drive index, detail, results and vote with concurrent clients.
+
+    Reports p50/p95/p99 latency, requests per second and queries per
+    request for each endpoint. With --output the report is saved as JSON
+    so runs on different commits can be compared.
+    """
+
+    help = "Load test the poll endpoints and report latency, throughput and queries."
+
+    def add_arguments(self, parser):
+        """Add seeding, load and output options."""
+        parser.add_argument("--seed-users", type=int, default=0,
+                            help="Create this many users before the run.")
+        parser.add_argument("--seed-questions", type=int, default=0,
+                            help="Create this many questions before the run.")
+        parser.add_argument("--seed-choices", type=int, default=4,
+                            help="Choices of each seeded question.")
+        parser.add_argument("--seed-votes", type=int, default=1000,
+                            help="Votes in total on the seeded questions.")
+        parser.add_argument("--random-seed", type=int, default=0,
+                            help="Seed of the data and request generators.")
+        parser.add_argument("--clients", type=int, default=8,
+                            help="Number of concurrent clients.")
+        parser.add_argument("--requests", type=int, default=50,
+                            help="Requests sent by each client.")
+        parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                            help="Endpoint to drive, can be repeated (default all).")
+        parser.add_argument("--polls", type=int, default=100,
+                            help="Number of newest open polls the clients pick from.")
+        parser.add_argument("--url",
+                            help="Base URL of a running server, instead of the in-process test client.")
+        parser.add_argument("--server-pid", type=int,
+                            help="Process id of the server behind --url, to report its "
+                                 "peak memory and threads (Linux).")
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        """Seed if asked, run the load and print or save the report."""
+        if options["seed_users"] or options["seed_questions"]:
+            self.seed(options)
+        polls = self.open_polls(options["polls"])
+        users = list(User.objects.filter(username__startswith="bench").order_by("pk")[:options["clients"]])
+        if not polls:
+            raise CommandError("No open polls with choices, use --seed-questions to create some.")
+        if not users and "vote" in (options["scenario"] or SCENARIOS):
+            raise CommandError("No benchmark users, use --seed-users to create some.")
+
+        report = {
+            "commit": current_commit(),
+            "created": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "target": options["url"] or "test client",
+            "clients": options["clients"],
+            "requests_per_client": options["requests"],
+            "results": run_load(polls, users, tuple(options["scenario"] or SCENARIOS),
+                                clients=options["clients"],
+                                requests_per_client=options["requests"],
+                                base_url=options["url"], seed=options["random_seed"],
+                                server_pid=options["server_pid"]),
+        }
+        for name, stats in report["results"].items():
+            self.stdout.write(
+                f"{name:8} {stats['requests']:6} req {stats['requests_per_second']:9.2f} req/s  "
+                f"p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+                f"p99 {stats['p99_ms']:8.2f} ms  queries {stats['queries_per_request']}  "
+                f"errors {stats['errors']}")
+        server = report["results"]["total"].get("server")
+        if server:
+            self.stdout.write(f"server   peak RSS {server['peak_rss_mb']} MB, "
+                              f"peak threads {server['peak_threads']}")
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report saved to {options['output']}"))
+
+    def seed(self, options):
+        """Seed users and polls, unless a run with the same random seed already did."""
+        prefix = f"bench{options['random_seed']}"
+        if User.objects.filter(username__startswith=f"{prefix}-user-").exists():
+            self.stdout.write(f"Data of --random-seed {options['random_seed']} already seeded, reusing it.")
+            return
+        seed_polls(options["seed_users"], options["seed_questions"],
+                   options["seed_choices"], options["seed_votes"],
+                   seed=options["random_seed"], distribution="zipf", prefix=prefix)
+
+    def open_polls(self, limit):
+        """Return newest open polls as a dict of question id to choice ids."""
+        now = timezone.now()
+        question_ids = list(Question.objects.filter(pub_date__lte=now, end_date__isnull=True)
+                            .order_by("-pub_date", "-id").values_list("id", flat=True)[:limit])
+        polls = {}
+        for question_id, choice_id in (Choice.objects.filter(question_id__in=question_ids)
+                                       .values_list("question_id", "id")):
+            polls.setdefault(question_id, []).append(choice_id)
+        return polls
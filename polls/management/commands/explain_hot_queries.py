@@ -0,0 +1,58 @@
+"""Command for showing query plans and timings of the hot poll queries."""
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from polls.models import Choice, Question, Vote
+
+
+def hot_queries(user, question):
+    """Return the hot querysets of ku-polls by name."""
+    now = timezone.now()
+    return {
+        "index page": Question.objects.filter(pub_date__lte=now).order_by("-pub_date", "-id")[:20],
+        "open polls": Question.objects.filter(pub_date__lte=now, end_date__gte=now),
+        "previous vote": Vote.objects.filter(user=user, question=question),
+        "vote on choice": Vote.objects.filter(user=user, choice__question=question),
+        "choice votes": Choice.objects.filter(question=question).values("pk", "vote_count"),
+    }
+
+
+class Command(BaseCommand):
+    """Print the plan and average time of each hot query on the current database.
+
+    Run it before and after "migrate polls 0007" / "migrate polls" to
+    compare the plans without and with the indexes of migration 0008.
+    """
+
+    help = "Show query plans and timings of the hot poll queries."
+
+    def add_arguments(self, parser):
+        """Add --repeat and --analyze options."""
+        parser.add_argument("--repeat", type=int, default=100,
+                            help="How many times each query is run for timing.")
+        parser.add_argument("--analyze", action="store_true",
+                            help="Use EXPLAIN ANALYZE (PostgreSQL only).")
+
+    def handle(self, *args, **options):
+        """Explain and time each hot query."""
+        user = User.objects.order_by("pk").first()
+        question = Question.objects.order_by("-pub_date").first()
+        if user is None or question is None:
+            raise CommandError("The database needs at least one user and one question.")
+        explain_options = {}
+        if options["analyze"] and connection.vendor == "postgresql":
+            explain_options["analyze"] = True
+        self.stdout.write(f"database: {connection.vendor}, "
+                          f"{Question.objects.count()} questions, {Vote.objects.count()} votes")
+        for name, queryset in hot_queries(user, question).items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain(**explain_options))
+            start = time.perf_counter()
+            for _ in range(options["repeat"]):
+                list(queryset.all())
+            elapsed = (time.perf_counter() - start) / options["repeat"]
+            self.stdout.write(f"average: {elapsed * 1000:.3f} ms over {options['repeat']} runs")
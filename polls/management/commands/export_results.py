@@ -0,0 +1,40 @@
+"""Command for exporting results or raw votes of a question."""
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.export import FORMATS, KINDS, export_lines
+from polls.models import Question
+
+
+class Command(BaseCommand):
+    """Write per choice results or raw votes of a question as CSV or NDJSON.
+
+    Rows are streamed from the database in chunks, so memory stays
+    flat for questions with millions of votes.
+    """
+
+    help = "Export results or votes of a question as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        """Add question id and export options."""
+        parser.add_argument("question_id", type=int, help="Id of the question to export.")
+        parser.add_argument("--kind", choices=KINDS, default="results",
+                            help="Per choice results or raw votes.")
+        parser.add_argument("--format", choices=FORMATS, default="csv", dest="export_format",
+                            help="Output format.")
+        parser.add_argument("--chunk-size", type=int, default=2000,
+                            help="Rows fetched from the database at a time.")
+        parser.add_argument("--output", help="File to write, standard output by default.")
+
+    def handle(self, *args, **options):
+        """Stream the export to the output."""
+        question_id = options["question_id"]
+        if not Question.objects.filter(pk=question_id).exists():
+            raise CommandError(f"Question {question_id} does not exist.")
+        lines = export_lines(question_id, options["kind"], options["export_format"],
+                             options["chunk_size"])
+        if options["output"]:
+            with open(options["output"], "w", newline="") as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
@@ -0,0 +1,58 @@
+"""Command for importing votes from large JSON, NDJSON or CSV files."""
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.importer import FORMATS, VoteImporter, guess_format, read_records
+
+
+class Command(BaseCommand):
+    """Stream votes from a file and write them with bulk upserts in batches.
+
+    The file is parsed one record at a time and users and choices are
+    looked up in id maps, so memory stays flat for multi-GB inputs.
+    A user keeps one vote per question, the last one read.
+    """
+
+    help = "Import votes from a JSON fixture, NDJSON or CSV file."
+
+    def add_arguments(self, parser):
+        """Add the input file and batch options."""
+        parser.add_argument("path", help="File to import, - for standard input.")
+        parser.add_argument("--format", choices=FORMATS, dest="file_format",
+                            help="Input format, guessed from the file extension by default.")
+        parser.add_argument("--batch-size", type=int, default=5000,
+                            help="Votes written per bulk upsert and transaction.")
+        parser.add_argument("--skip-existing", action="store_true",
+                            help="Keep stored votes instead of replacing them.")
+
+    def handle(self, *args, **options):
+        """Import the file and report the rate."""
+        path = options["path"]
+        file_format = options["file_format"] or guess_format(path)
+        self.verbosity = options["verbosity"]
+        self.started = time.perf_counter()
+        importer = VoteImporter(batch_size=options["batch_size"],
+                                skip_existing=options["skip_existing"])
+        try:
+            if path == "-":
+                importer.import_records(read_records(sys.stdin, file_format), self.report_progress)
+            else:
+                with open(path, newline="", encoding="utf-8") as stream:
+                    importer.import_records(read_records(stream, file_format),
+                                            self.report_progress)
+        except (OSError, ValueError) as error:
+            raise CommandError(f"Import of {path} stopped after {importer.read} rows: {error}")
+        elapsed = time.perf_counter() - self.started
+        rate = importer.read / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {importer.read} rows, wrote {importer.written} votes, "
+            f"{importer.replaced} duplicates, {importer.skipped} skipped "
+            f"in {elapsed:.1f}s ({rate:.0f} rows/s)."))
+
+    def report_progress(self, importer):
+        """Print rows read so far when verbosity is above 1."""
+        if self.verbosity > 1:
+            elapsed = time.perf_counter() - self.started
+            self.stdout.write(f"{importer.read} rows ({importer.read / elapsed:.0f} rows/s)")
@@ -0,0 +1,37 @@
+"""Command for reading the hit and miss counters of the results cache."""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from polls.cache import RESULTS_CACHE, cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    """Show hits, misses and hit ratio of the poll results cache.
+
+    Counters live in the results cache itself, so with the locmem
+    backend they only cover the process running the command.
+    Use the file or db backend to read them across processes. They are
+    only counted with RESULTS_CACHE_STATS on.
+    """
+
+    help = "Show hit and miss counters of the poll results cache."
+
+    def add_arguments(self, parser):
+        """Add --reset option."""
+        parser.add_argument("--reset", action="store_true",
+                            help="Set the counters back to zero after showing them.")
+
+    def handle(self, *args, **options):
+        """Print the counters of the results cache."""
+        if not settings.RESULTS_CACHE_STATS:
+            self.stdout.write(self.style.WARNING("RESULTS_CACHE_STATS is off, lookups are not counted."))
+        stats = cache_stats()
+        lookups = stats["hits"] + stats["misses"]
+        ratio = stats["hits"] / lookups if lookups else 0.0
+        self.stdout.write(f"backend: {settings.CACHES[RESULTS_CACHE]['BACKEND']}")
+        self.stdout.write(f"hits: {stats['hits']}")
+        self.stdout.write(f"misses: {stats['misses']}")
+        self.stdout.write(f"hit ratio: {ratio:.1%}")
+        if options["reset"]:
+            reset_cache_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
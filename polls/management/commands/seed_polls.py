@@ -0,0 +1,59 @@
+"""Command for generating large amounts of synthetic poll data."""
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.seeding import DISTRIBUTIONS, PollSeeder
+
+
+class Command(BaseCommand):
+    """Create users, questions, choices and votes with bulk_create in batches.
+
+    Memory use is bounded by the batch size and the list of user ids,
+    so millions of rows can be generated. The same --seed give the same data.
+    """
+
+    help = "Generate synthetic users, polls and votes for capacity testing."
+
+    def add_arguments(self, parser):
+        """Add size and distribution options."""
+        parser.add_argument("--users", type=int, default=1000, help="Number of users.")
+        parser.add_argument("--questions", type=int, default=100, help="Number of questions.")
+        parser.add_argument("--choices", type=int, default=4, help="Choices of each question.")
+        parser.add_argument("--votes", type=int, default=10000,
+                            help="Number of votes in total, at most one per user and question.")
+        parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="zipf",
+                            help="Popularity of polls and choices.")
+        parser.add_argument("--exponent", type=float, default=1.0,
+                            help="Exponent of the zipf distribution.")
+        parser.add_argument("--closed-fraction", type=float, default=0.0,
+                            help="Share of questions that are already closed.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator.")
+        parser.add_argument("--batch-size", type=int, default=5000,
+                            help="Rows written per bulk_create and transaction.")
+        parser.add_argument("--prefix", default="seed",
+                            help="Prefix of generated usernames and question texts.")
+
+    def handle(self, *args, **options):
+        """Generate the data and report progress."""
+        prefix = options["prefix"]
+        if User.objects.filter(username__startswith=f"{prefix}-user-").exists():
+            raise CommandError(f"Users with prefix '{prefix}' already exist, choose another --prefix.")
+        self.started = time.perf_counter()
+        seeder = PollSeeder(seed=options["seed"], batch_size=options["batch_size"],
+                            prefix=prefix, distribution=options["distribution"],
+                            exponent=options["exponent"],
+                            closed_fraction=options["closed_fraction"],
+                            progress=self.report_progress)
+        created = seeder.seed(options["users"], options["questions"],
+                              options["choices"], options["votes"])
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created['users']} users, {created['questions']} questions, "
+            f"{created['choices']} choices and {created['votes']} votes in {elapsed:.1f}s."))
+
+    def report_progress(self, stage, done, total):
+        """Print how far a stage is."""
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(f"{stage}: {done}/{total} ({elapsed:.1f}s)")
@@ -0,0 +1,61 @@
+"""Command for freezing the results of closed polls."""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.models import Question
+from polls.snapshots import archive_votes, sweep_snapshots, take_snapshot
+
+
+class Command(BaseCommand):
+    """Take results snapshots of polls that ended, meant to run periodically.
+
+    Polls are taken once, so a run every few minutes from cron or a
+    scheduler only reads the polls that closed since the last run.
+    """
+
+    help = "Freeze the results of closed polls, optionally archiving their votes."
+
+    def add_arguments(self, parser):
+        """Add sweep and archive options."""
+        parser.add_argument("--grace", type=int, default=60,
+                            help="Seconds after the end date before a poll is taken.")
+        parser.add_argument("--limit", type=int, help="Most polls taken in this run.")
+        parser.add_argument("--archive-dir",
+                            help="Write the votes of each poll taken to this directory "
+                                 "and delete them from the database.")
+        parser.add_argument("--question", type=int, action="append", dest="question_ids",
+                            help="Take the snapshot of this closed question again, "
+                                 "can be repeated.")
+
+    def handle(self, *args, **options):
+        """Take the snapshots and report them."""
+        archive_dir = options["archive_dir"]
+        if archive_dir and not os.path.isdir(archive_dir):
+            raise CommandError(f"{archive_dir} is not a directory.")
+        if options["question_ids"]:
+            taken = self.retake(options["question_ids"], archive_dir)
+        else:
+            taken = sweep_snapshots(grace=options["grace"], limit=options["limit"],
+                                    archive_dir=archive_dir)
+        count = 0
+        for snapshot, archived in taken:
+            count += 1
+            line = f"Question {snapshot.question_id}: {snapshot.total} votes"
+            if archive_dir:
+                line += f", {archived} archived"
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Took {count} snapshot(s)."))
+
+    def retake(self, question_ids, archive_dir):
+        """Yield new snapshots of the given questions, which must have ended."""
+        questions = Question.objects.filter(pk__in=question_ids).order_by("id")
+        for question in questions:
+            if not question.end_date or question.can_vote() or not question.is_published():
+                raise CommandError(f"Question {question.id} is not closed.")
+        for question in questions:
+            snapshot = take_snapshot(question)
+            archived = 0
+            if archive_dir and snapshot.votes_archived_at is None:
+                archived = archive_votes(snapshot, archive_dir)
+            yield snapshot, archived
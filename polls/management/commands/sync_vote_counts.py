@@ -0,0 +1,58 @@
+"""Command for rebuilding the denormalized vote counters of choices."""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Exists, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from polls.cache import invalidate_results
+from polls.models import ArchivedVote, Choice, Vote
+
+
+def counted_votes():
+    """Return an expression counting Vote and ArchivedVote rows of the outer choice."""
+    def count(model):
+        counts = (model.objects.filter(choice=OuterRef("pk"))
+                  .order_by().values("choice").annotate(total=Count("pk")).values("total"))
+        return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+    return count(Vote) + count(ArchivedVote)
+
+
+class Command(BaseCommand):
+    """Check or rebuild Choice.vote_count against the Vote table.
+
+    Votes moved by archive_votes are counted from the archive table.
+    Choices of polls whose votes were archived to files (see
+    snapshot_results), archived without ArchivedVote rows, are left out.
+    """
+
+    help = "Rebuild Choice.vote_count from Vote rows, or only report mismatches with --check."
+
+    def add_arguments(self, parser):
+        """Add --check option."""
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Only report choices whose counter differs, exit with error if any.")
+
+    def handle(self, *args, **options):
+        """Compare counters with Vote rows and fix them unless --check is given."""
+        with transaction.atomic():
+            choices = (Choice.objects.select_for_update()
+                       .exclude(Q(question__snapshot__votes_archived_at__isnull=False)
+                                & ~Exists(ArchivedVote.objects.filter(question=OuterRef("question"))))
+                       .annotate(counted=counted_votes())
+                       .values_list("pk", "vote_count", "counted"))
+            mismatched = [(pk, stored, counted) for pk, stored, counted in choices
+                          if stored != counted]
+            for pk, stored, counted in mismatched:
+                self.stdout.write(f"Choice {pk}: vote_count={stored}, votes={counted}")
+            if options["check"]:
+                if mismatched:
+                    raise CommandError(f"{len(mismatched)} choice counter(s) out of sync.")
+                self.stdout.write(self.style.SUCCESS("All choice counters are in sync."))
+                return
+            if mismatched:
+                fixed = Choice.objects.filter(pk__in=[pk for pk, _, _ in mismatched])
+                fixed.update(vote_count=counted_votes())
+                for question_id in set(fixed.values_list("question_id", flat=True)):
+                    invalidate_results(question_id)
+        self.stdout.write(self.style.SUCCESS(f"Fixed {len(mismatched)} choice counter(s)."))
@@ -0,0 +1,11 @@
+"""Statistics shared by the request metrics and the load test."""
+import math
+
+
+def percentile(values, percent):
+    """Return the percent-th percentile of values, by nearest rank."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1))
+    return ordered[rank]
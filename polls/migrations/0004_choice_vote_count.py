@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-18 02:36
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_votes(apps, schema_editor):
+    """Fill vote_count from the votes already in the database."""
+    Choice = apps.get_model('polls', 'Choice')
+    Vote = apps.get_model('polls', 'Vote')
+    counts = (Vote.objects.filter(choice=OuterRef('pk'))
+              .order_by().values('choice').annotate(total=Count('pk')).values('total'))
+    Choice.objects.update(
+        vote_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0003_remove_choice_votes_vote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='vote_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_votes, migrations.RunPython.noop),
+    ]
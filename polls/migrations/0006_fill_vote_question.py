@@ -0,0 +1,34 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:10
+
+from django.db import migrations
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_question_and_dedupe(apps, schema_editor):
+    """Set question of every vote and keep only the latest vote per user and question."""
+    Choice = apps.get_model('polls', 'Choice')
+    Vote = apps.get_model('polls', 'Vote')
+    Vote.objects.update(question_id=Subquery(
+        Choice.objects.filter(pk=OuterRef('choice_id')).values('question_id')[:1]))
+    duplicates = (Vote.objects.order_by().values('user_id', 'question_id')
+                  .annotate(total=Count('pk'), latest=Max('pk')).filter(total__gt=1))
+    for group in list(duplicates):
+        (Vote.objects.filter(user_id=group['user_id'], question_id=group['question_id'])
+         .exclude(pk=group['latest']).delete())
+    counts = (Vote.objects.filter(choice=OuterRef('pk'))
+              .order_by().values('choice').annotate(total=Count('pk')).values('total'))
+    Choice.objects.update(
+        vote_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_vote_question'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_question_and_dedupe, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultsSnapshot',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='polls.question')),
+                ('results', models.JSONField()),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('closed_at', models.DateTimeField(verbose_name='date poll ended')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date snapshot taken')),
+                ('votes_archived_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='date votes archived')),
+            ],
+        ),
+    ]
@@ -1,7 +1,10 @@
 """Model of Poll application for ku-polls project."""
 import datetime
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.contrib.auth.models import User
 
@@ -14,6 +17,14 @@ class Question(models.Model):
     end_date = models.DateTimeField("date poll ended", default=None,
                                     blank=True, null=True)
 
+    class Meta:
+        """Index the dates used to list and filter published polls."""
+
+        indexes = [
+            models.Index(fields=["pub_date", "id"], name="polls_question_pub_date_idx"),
+            models.Index(fields=["end_date"], name="polls_question_end_date_idx"),
+        ]
+
     def __str__(self) -> str:
         """Return question text of Question object."""
         return str(self.question_text)
@@ -44,10 +55,13 @@ class Choice(models.Model):
 
     Contain Question as ForeignKey, choice text
     and the vote count that have been vote on the chioce.
+    vote_count is a denormalized counter kept in step with Vote rows,
+    use the sync_vote_counts command to rebuild it.
     """
 
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
+    vote_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:
         """Return choice text of the choice."""
@@ -56,15 +70,138 @@ class Choice(models.Model):
     @property
     def votes(self):
         """Return vote count for this choice."""
-        return self.vote_set.count()
+        return self.vote_count
 
 
 class Vote(models.Model):
-    """Record a choice for a question made by a user."""
+    """Record a choice for a question made by a user.
+
+    A user has at most one vote per question, question is kept
+    alongside choice so this can be enforced by the database.
+    """
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
 
+    class Meta:
+        """A user can vote only once on each question.
+
+        The unique constraint also index (user, question) lookups.
+        """
+
+        constraints = [
+            models.UniqueConstraint(fields=["user", "question"],
+                                    name="unique_vote_per_question"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "choice"], name="polls_vote_user_choice_idx"),
+        ]
+
     def __str__(self) -> str:
         """Show vote's owner and choice text user vote for in sentence."""
         return f'Vote by {self.user.username} for {self.choice.choice_text}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the choice a vote was loaded with."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_choice_id = instance.__dict__.get("choice_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Save the vote and move the choice vote counters with it.
+
+        A new vote add one to its choice, a changed vote take one
+        from the old choice and add one to the new choice.
+        """
+        if self.question_id is None:
+            self.question_id = self.choice.question_id
+        old_choice_id = getattr(self, "_loaded_choice_id", None)
+        is_new = self._state.adding
+        # part of the caller's transaction if there is one, no savepoint.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if not is_new and old_choice_id == self.choice_id:
+                return
+            if not is_new and old_choice_id is not None:
+                Choice.objects.filter(pk=old_choice_id, vote_count__gt=0).update(
+                    vote_count=F("vote_count") - 1)
+            Choice.objects.filter(pk=self.choice_id).update(
+                vote_count=F("vote_count") + 1)
+        # keep an already loaded choice in step with the database.
+        if Vote.choice.is_cached(self):
+            self.choice.vote_count += 1
+        self._loaded_choice_id = self.choice_id
+
+
+@receiver(post_delete, sender=Vote)
+def decrease_vote_count(sender, instance, **kwargs):
+    """Take a deleted vote out of its choice counter."""
+    Choice.objects.filter(pk=instance.choice_id, vote_count__gt=0).update(
+        vote_count=F("vote_count") - 1)
+
+
+class ArchivedVote(models.Model):
+    """A vote of a long closed poll, moved out of the Vote table.
+
+    Archived votes keep the id they had as a Vote, so moving the same
+    vote twice is a no-op. They still count in the choice vote counters,
+    until they are deleted.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    archived_at = models.DateTimeField("date archived", default=timezone.now)
+
+    class Meta:
+        """Archived votes are read per question, in vote order."""
+
+        indexes = [
+            models.Index(fields=["question", "id"], name="polls_archived_question_idx"),
+        ]
+
+    def __str__(self) -> str:
+        """Show archived vote's owner and choice."""
+        return f'Archived vote by {self.user.username} for {self.choice.choice_text}'
+
+
+# an archived vote is still counted, deleting it (e.g. with its user) takes it out.
+post_delete.connect(decrease_vote_count, sender=ArchivedVote)
+
+
+class ResultsSnapshot(models.Model):
+    """Final results of a closed poll.
+
+    results holds the same dict as results.get_results, taken once the
+    poll has ended, so they can be served and cached without reading
+    the choices or votes again. votes_archived_at is set when the votes
+    of the question were moved out of the Vote table.
+    """
+
+    question = models.OneToOneField(Question, on_delete=models.CASCADE,
+                                    primary_key=True, related_name="snapshot")
+    results = models.JSONField()
+    total = models.PositiveIntegerField(default=0)
+    closed_at = models.DateTimeField("date poll ended")
+    created_at = models.DateTimeField("date snapshot taken", default=timezone.now)
+    votes_archived_at = models.DateTimeField("date votes archived", default=None,
+                                             blank=True, null=True)
+
+    def __str__(self) -> str:
+        """Return the question and total of the snapshot."""
+        return f"Results of {self.results['question_text']} ({self.total} votes)"
+
+
+@receiver(post_save, sender=Question)
+def drop_snapshot_of_reopened_poll(sender, instance, created, **kwargs):
+    """Drop the results snapshot of a question whose end date was moved out of the past.
+
+    Snapshots of questions whose votes were archived are kept, their
+    votes are no longer in the Vote table to recount.
+    """
+    if created or instance.end_date is not None and instance.end_date <= timezone.now():
+        return
+    ResultsSnapshot.objects.filter(question=instance, votes_archived_at__isnull=True).delete()
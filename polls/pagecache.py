@@ -0,0 +1,163 @@
+"""Full-page cache of anonymous pages and cache timeouts of poll pages.
+
+Cached pages are keyed by the page version of their scope (see
+cache.page_version), so a vote or a question edit hides them at once.
+The index also changes on its own when a poll is published or ends,
+so its pages time out at the next of these dates.
+"""
+import hashlib
+import math
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib import messages
+from django.db.models import Min, Q
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+    )
+from django.utils.http import http_date, quote_etag
+
+from .cache import apage_version, page_version, results_cache
+from .models import Question
+
+
+def next_index_change(now):
+    """Return the next publication or end date of any question after now, or None."""
+    dates = Question.objects.aggregate(
+        next_pub_date=Min("pub_date", filter=Q(pub_date__gt=now)),
+        next_end_date=Min("end_date", filter=Q(end_date__gt=now)))
+    return min((date for date in dates.values() if date is not None), default=None)
+
+
+def index_timeout():
+    """Return seconds the index pages of the current version stay valid.
+
+    The next publication or end date is looked up once per index version.
+    """
+    cache = results_cache()
+    now = timezone.now()
+    key = f"polls:index:next-change:{page_version('index')}"
+    next_change = cache.get(key)
+    if next_change is None or next_change is not False and next_change <= now:
+        next_change = next_index_change(now) or False
+        cache.set(key, next_change, timeout=None)
+    if next_change is False:
+        return cache.default_timeout
+    seconds = math.ceil((next_change - now).total_seconds())
+    return max(1, min(seconds, cache.default_timeout))
+
+
+def has_messages(request):
+    """Return whether messages are waiting to be shown to this visitor."""
+    return len(messages.get_messages(request)) > 0
+
+
+def page_key(request, scope, version):
+    """Return the cache key of the page of a request."""
+    path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"polls:page:{scope}:{version}:{path_hash}"
+
+
+def page_entry(response):
+    """Return the cache entry of a rendered response, or None if it is not cacheable."""
+    if response.status_code != 200 or response.streaming:
+        return None
+    if hasattr(response, "render"):
+        response.render()
+    return {
+        "content": response.content,
+        "content_type": response["Content-Type"],
+        "etag": quote_etag(hashlib.md5(response.content).hexdigest()),
+        "last_modified": int(timezone.now().timestamp()),
+    }
+
+
+def page_response(request, page):
+    """Return the response of a cached page, a 304 if the browser has it."""
+    response = (get_conditional_response(request, etag=page["etag"],
+                                         last_modified=page["last_modified"])
+                or HttpResponse(page["content"], content_type=page["content_type"]))
+    response["ETag"] = page["etag"]
+    response["Last-Modified"] = http_date(page["last_modified"])
+    patch_cache_control(response, max_age=0, must_revalidate=True)
+    patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+def anonymous_page_cache(scope, timeout=None):
+    """Serve GET pages of anonymous visitors from the results cache.
+
+    Every answer carries an ETag and Last-Modified, so browsers get a
+    304 while the page has not changed. Pages of logged-in users, or of
+    visitors with messages to show, are rendered each time. Works on
+    sync and async views.
+
+    Args:
+        scope : callable returning the page version scope from the view kwargs
+        timeout : callable returning the seconds a page is kept, or None for the default
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return async_page_cache(view, scope, timeout)
+        return sync_page_cache(view, scope, timeout)
+    return decorator
+
+
+def is_cacheable(request):
+    """Return whether the page of a request may come from the cache.
+
+    The user of the request must be loaded already.
+    """
+    return (request.method in ("GET", "HEAD") and not request.user.is_authenticated
+            and not has_messages(request))
+
+
+def uncached_response(response):
+    """Return a response that was not cached, marked as varying with the cookies."""
+    patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+def sync_page_cache(view, scope, timeout):
+    """Wrap a sync view in the page cache of anonymous_page_cache."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_cacheable(request):
+            return uncached_response(view(request, *args, **kwargs))
+        cache = results_cache()
+        key = page_key(request, scope(kwargs), page_version(scope(kwargs)))
+        page = cache.get(key)
+        if page is None:
+            response = view(request, *args, **kwargs)
+            page = page_entry(response)
+            if page is None:
+                return uncached_response(response)
+            cache.set(key, page, **({"timeout": timeout()} if timeout else {}))
+        return page_response(request, page)
+    return wrapper
+
+
+def async_page_cache(view, scope, timeout):
+    """Wrap an async view in the page cache of anonymous_page_cache."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # a loaded user, so the templates do not query from the event loop.
+        request.user = await request.auser()
+        if not is_cacheable(request):
+            return uncached_response(await view(request, *args, **kwargs))
+        cache = results_cache()
+        key = page_key(request, scope(kwargs), await apage_version(scope(kwargs)))
+        page = await cache.aget(key)
+        if page is None:
+            response = await view(request, *args, **kwargs)
+            page = page_entry(response)
+            if page is None:
+                return uncached_response(response)
+            page_timeout = {"timeout": await sync_to_async(timeout)()} if timeout else {}
+            await cache.aset(key, page, **page_timeout)
+        return page_response(request, page)
+    return wrapper
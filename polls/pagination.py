@@ -0,0 +1,132 @@
+"""Keyset pagination of questions on (pub_date, id), and estimated counts."""
+import base64
+import datetime
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def encode_cursor(question):
+    """Return an opaque cursor pointing at a question."""
+    raw = f"{question.pub_date.isoformat()}|{question.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (pub_date, id) of a cursor made by encode_cursor.
+
+    Raises:
+        ValueError: if the cursor is not valid.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        pub_date, pk = raw.split("|")
+        return datetime.datetime.fromisoformat(pub_date), int(pk)
+    except (UnicodeError, TypeError, ValueError) as error:
+        raise ValueError(f"Invalid cursor {cursor!r}") from error
+
+
+class KeysetPage:
+    """A page of questions with the cursors of its neighbour pages."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        """Keep the page content and cursors."""
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        """Iterate over questions of the page."""
+        return iter(self.object_list)
+
+    def __len__(self):
+        """Return number of questions on the page."""
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Paginate questions newest first, ordered by (pub_date, id).
+
+    Pages are found by seeking past the last seen (pub_date, id) instead
+    of an OFFSET, so every page costs one indexed query however deep it is.
+    """
+
+    def __init__(self, queryset, page_size):
+        """Keep the queryset to paginate and the page size."""
+        self.queryset = queryset
+        self.page_size = page_size
+
+    def page(self, after=None, before=None):
+        """Return the page after or before a cursor, or the first page.
+
+        Args:
+            after : cursor of the last question of the previous page
+            before : cursor of the first question of the next page
+        """
+        queryset = self._page_queryset(after, before)
+        return self._make_page(list(queryset), after, before)
+
+    async def apage(self, after=None, before=None):
+        """Return the same page as page(), read with async iteration."""
+        queryset = self._page_queryset(after, before)
+        return self._make_page([question async for question in queryset], after, before)
+
+    def _page_queryset(self, after, before):
+        """Return the query of a page and one more question, to know if there is a next page.
+
+        Questions before a cursor are read oldest first.
+        """
+        if before:
+            pub_date, pk = decode_cursor(before)
+            newer = Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+            return self.queryset.filter(newer).order_by("pub_date", "pk")[:self.page_size + 1]
+        queryset = self.queryset
+        if after:
+            pub_date, pk = decode_cursor(after)
+            older = Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk)
+            queryset = queryset.filter(older)
+        return queryset.order_by("-pub_date", "-pk")[:self.page_size + 1]
+
+    def _make_page(self, rows, after, before):
+        """Return the page of the rows read by the query of _page_queryset."""
+        if before:
+            questions = rows[:self.page_size][::-1]
+            return KeysetPage(
+                questions,
+                next_cursor=encode_cursor(questions[-1]) if questions else None,
+                previous_cursor=encode_cursor(questions[0]) if len(rows) > self.page_size else None,
+            )
+        questions = rows[:self.page_size]
+        return KeysetPage(
+            questions,
+            next_cursor=encode_cursor(questions[-1]) if len(rows) > self.page_size else None,
+            previous_cursor=encode_cursor(questions[0]) if after and questions else None,
+        )
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator using the planner's row estimate of large unfiltered tables.
+
+    On PostgreSQL an unfiltered COUNT(*) reads the whole table, so for
+    tables of more than exact_limit rows the reltuples statistic of
+    pg_class is used instead. Filtered querysets and other databases
+    are counted exactly.
+    """
+
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        """Return the estimated or exact number of objects."""
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > self.exact_limit:
+                return row[0]
+        return super().count
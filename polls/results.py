@@ -0,0 +1,70 @@
+"""Aggregated poll results for ku-polls project."""
+from .models import Question
+
+
+def results_rows(question_id, use_snapshot=True):
+    """Return the query of get_results, one row per choice of the question."""
+    fields = ["question_text", "choice__id", "choice__choice_text", "choice__vote_count"]
+    if use_snapshot:
+        fields.append("snapshot__results")
+    return Question.objects.filter(pk=question_id).order_by("choice__id").values_list(*fields)
+
+
+def results_from_rows(question_id, rows):
+    """Return the results dict of the rows of results_rows.
+
+    Raises:
+        Question.DoesNotExist: if there are no rows.
+    """
+    if not rows:
+        raise Question.DoesNotExist(f"Question {question_id} does not exist.")
+    snapshot = rows[0][4] if len(rows[0]) > 4 else None
+    if snapshot is not None:
+        return dict(snapshot, final=True)
+    choices = [
+        {"id": choice_id, "choice_text": text, "votes": votes}
+        for _, choice_id, text, votes, *_ in rows
+        if choice_id is not None
+    ]
+    return {
+        "id": question_id,
+        "question_text": rows[0][0],
+        "choices": choices,
+        "total": sum(choice["votes"] for choice in choices),
+        "final": False,
+    }
+
+
+def get_results(question_id, use_snapshot=True):
+    """Return question text, choices and vote totals of a question.
+
+    Everything is read in one query joining the question to its choices
+    and their vote counters. A question with a results snapshot returns
+    the snapshot, marked "final".
+
+    Args:
+        question_id : integer id of polls question
+        use_snapshot : False to read the choice counters even if there is a snapshot
+
+    Raises:
+        Question.DoesNotExist: if there is no question with this id.
+    """
+    return results_from_rows(question_id, list(results_rows(question_id, use_snapshot)))
+
+
+async def aget_results(question_id):
+    """Return the results of get_results, read with async iteration.
+
+    Raises:
+        Question.DoesNotExist: if there is no question with this id.
+    """
+    return results_from_rows(question_id, [row async for row in results_rows(question_id)])
+
+
+def with_percentages(results):
+    """Return the choices of results with their share of the total vote."""
+    total = results["total"]
+    return [
+        dict(choice, percent=round(100 * choice["votes"] / total, 1) if total else 0.0)
+        for choice in results["choices"]
+    ]
@@ -0,0 +1,174 @@
+"""Synthetic users, polls and votes for benchmarks and capacity tests."""
+import datetime
+import random
+from array import array
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Choice, Question, Vote
+
+SEED_PASSWORD = "benchmark"
+DISTRIBUTIONS = ("uniform", "zipf")
+
+
+def batched(iterable, size):
+    """Yield lists of at most size items from iterable."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def popularity(count, distribution="uniform", exponent=1.0):
+    """Return the relative popularity of count ranked items.
+
+    With "zipf" the item of rank k weigh 1 / k ** exponent, so a few
+    items take most of the votes.
+    """
+    if distribution == "uniform":
+        return [1.0] * count
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+def vote_shares(count, total, distribution="uniform", exponent=1.0):
+    """Yield how many of total votes go to each of count items.
+
+    Shares are rounded on the running sum so they always add up to total.
+    """
+    weights = popularity(count, distribution, exponent)
+    weights_sum = sum(weights)
+    running = 0.0
+    given = 0
+    for weight in weights:
+        running += weight
+        share = round(total * running / weights_sum) - given
+        given += share
+        yield share
+
+
+class PollSeeder:
+    """Create users, questions, choices and votes in bounded memory.
+
+    Rows are written with bulk_create in batches of batch_size, one
+    transaction per batch, and only the user ids are kept in memory.
+    Every user share the password SEED_PASSWORD so benchmark clients can
+    log in. The same seed always give the same data.
+    """
+
+    def __init__(self, seed=0, batch_size=5000, prefix="seed", distribution="uniform",
+                 exponent=1.0, closed_fraction=0.0, progress=None):
+        """Keep the generator options.
+
+        Args:
+            seed : seed of the random generator
+            batch_size : rows written per bulk_create and transaction
+            prefix : prefix of usernames and question texts
+            distribution : "uniform" or "zipf" popularity of polls and choices
+            exponent : exponent of the zipf distribution
+            closed_fraction : share of polls that are already closed
+            progress : callable receiving (stage, done, total) after each batch
+        """
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.distribution = distribution
+        self.exponent = exponent
+        self.closed_fraction = closed_fraction
+        self.progress = progress or (lambda stage, done, total: None)
+        self.user_ids = array("q")
+
+    def seed(self, users, questions, choices, votes):
+        """Create users, questions with choices, and votes in total.
+
+        Returns:
+            a dict with the number of rows created of each kind.
+        """
+        self.create_users(users)
+        created_votes = self.create_polls(questions, choices, votes)
+        return {"users": len(self.user_ids), "questions": questions,
+                "choices": questions * choices, "votes": created_votes}
+
+    def create_users(self, count):
+        """Create count users and remember their ids."""
+        password = make_password(SEED_PASSWORD)
+        for start in range(0, count, self.batch_size):
+            batch = [User(username=f"{self.prefix}-user-{n}", password=password)
+                     for n in range(start, min(start + self.batch_size, count))]
+            self.user_ids.extend(user.pk for user in User.objects.bulk_create(batch))
+            self.progress("users", len(self.user_ids), count)
+
+    def create_polls(self, questions, choices, votes):
+        """Create questions with choices and share votes between them.
+
+        Returns:
+            the number of votes created.
+        """
+        now = timezone.now()
+        shares = vote_shares(questions, votes, self.distribution, self.exponent)
+        created_votes = 0
+        numbers = range(questions)
+        for batch in batched(numbers, max(1, self.batch_size // max(1, choices))):
+            with transaction.atomic():
+                new_questions = Question.objects.bulk_create([
+                    self.make_question(number, now) for number in batch])
+                new_choices = Choice.objects.bulk_create([
+                    Choice(question=question, choice_text=f"Choice {n}")
+                    for question in new_questions for n in range(choices)])
+                for index, question in enumerate(new_questions):
+                    question_choices = new_choices[index * choices:(index + 1) * choices]
+                    created_votes += self.create_votes(question, question_choices, next(shares))
+                Choice.objects.bulk_update(new_choices, ["vote_count"], batch_size=self.batch_size)
+            self.progress("questions", batch[-1] + 1, questions)
+        return created_votes
+
+    def make_question(self, number, now):
+        """Return an unsaved question, closed for closed_fraction of them."""
+        pub_date = now - datetime.timedelta(minutes=number + 1)
+        end_date = None
+        if self.rng.random() < self.closed_fraction:
+            end_date = pub_date + datetime.timedelta(seconds=30)
+        return Question(question_text=f"{self.prefix} question {number}",
+                        pub_date=pub_date, end_date=end_date)
+
+    def create_votes(self, question, question_choices, count):
+        """Create count votes by distinct users on a question.
+
+        Returns:
+            the number of votes created.
+        """
+        if not question_choices or not self.user_ids:
+            return 0
+        count = min(count, len(self.user_ids))
+        weights = popularity(len(question_choices), self.distribution, self.exponent)
+        voters = self.rng.sample(range(len(self.user_ids)), count)
+        for indexes in batched(voters, self.batch_size):
+            picked = self.rng.choices(question_choices, weights=weights, k=len(indexes))
+            new_votes = []
+            for index, choice in zip(indexes, picked):
+                choice.vote_count += 1
+                new_votes.append(Vote(user_id=self.user_ids[index], question=question, choice=choice))
+            Vote.objects.bulk_create(new_votes)
+        return count
+
+
+def seed_polls(users, questions, choices, votes, **options):
+    """Create users, questions and votes with a PollSeeder.
+
+    Args:
+        users : number of users to create
+        questions : number of questions to create
+        choices : number of choices of each question
+        votes : number of votes in total, shared between questions
+        options : options of PollSeeder
+
+    Returns:
+        a dict with the number of rows created of each kind.
+    """
+    return PollSeeder(**options).seed(users, questions, choices, votes)
@@ -0,0 +1,120 @@
+"""Final results snapshots of closed polls and archival of their votes.
+
+Once a poll has ended its results no longer change. sweep_snapshots
+freezes them into a ResultsSnapshot, which results.get_results then
+returns instead of reading the choices. The votes of a snapshotted
+poll can be written to a compressed NDJSON file and removed from the
+Vote table, the choice counters keep their totals.
+"""
+import datetime
+import gzip
+import os
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import invalidate_results
+from .export import VOTE_FIELDS, as_ndjson, vote_rows
+from .models import Question, ResultsSnapshot, Vote
+from .results import get_results
+
+
+def closed_questions(now=None, grace=60):
+    """Return questions that ended at least grace seconds ago and have no snapshot.
+
+    The grace period leaves time for buffered votes cast before the end
+    date to be written.
+    """
+    now = now or timezone.now()
+    return (Question.objects.filter(end_date__lte=now - datetime.timedelta(seconds=grace),
+                                    snapshot__isnull=True)
+            .order_by("end_date", "id"))
+
+
+def take_snapshot(question):
+    """Freeze the current results of a closed question, replacing its snapshot if any.
+
+    The results are read from the choice counters, which still count
+    archived votes, so a snapshot can be taken again after archival.
+    """
+    with transaction.atomic():
+        results = get_results(question.id, use_snapshot=False)
+        del results["final"]
+        snapshot, _ = ResultsSnapshot.objects.update_or_create(
+            question=question,
+            defaults={"results": results, "total": results["total"],
+                      "closed_at": question.end_date, "created_at": timezone.now()})
+        invalidate_results(question.id)
+    return snapshot
+
+
+def archive_path(directory, question_id):
+    """Return the archive file of the votes of a question."""
+    return os.path.join(directory, f"question-{question_id}-votes.ndjson.gz")
+
+
+def delete_votes(condition, params):
+    """Delete the votes matching an SQL condition, with a plain DELETE.
+
+    Archived votes are still counted: the choice counters and the
+    results snapshot keep their totals. QuerySet.delete() would send
+    post_delete for each vote, which takes it off its choice counter,
+    so the rows are deleted in SQL instead.
+
+    Args:
+        condition : WHERE clause on the vote table, with %s placeholders
+        params : values of the placeholders
+
+    Returns:
+        number of votes deleted
+    """
+    table = connection.ops.quote_name(Vote._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {condition}", params)
+        return cursor.rowcount
+
+
+def archive_votes(snapshot, directory, chunk_size=2000):
+    """Write the votes of a snapshotted question to a file, then delete them.
+
+    Only votes written to the file are deleted. They are deleted without
+    the post_delete signal, so the choice counters keep the totals of
+    the snapshot.
+
+    Returns:
+        number of votes archived
+    """
+    last_id = None
+    path = archive_path(directory, snapshot.question_id)
+
+    def exported_rows():
+        nonlocal last_id
+        for row in vote_rows(snapshot.question_id, chunk_size):
+            last_id = row[0]
+            yield row
+
+    with gzip.open(path, "wt") as archive:
+        archive.writelines(as_ndjson(VOTE_FIELDS, exported_rows()))
+    with transaction.atomic():
+        deleted = 0
+        if last_id is not None:
+            deleted = delete_votes("question_id = %s AND id <= %s",
+                                   [snapshot.question_id, last_id])
+        snapshot.votes_archived_at = timezone.now()
+        snapshot.save(update_fields=["votes_archived_at"])
+    return deleted
+
+
+def sweep_snapshots(now=None, grace=60, limit=None, archive_dir=None):
+    """Snapshot every closed question without one, and archive their votes if asked.
+
+    Yields:
+        (snapshot, archived vote count) for each question
+    """
+    questions = closed_questions(now, grace)
+    if limit:
+        questions = questions[:limit]
+    for question in questions.iterator():
+        snapshot = take_snapshot(question)
+        archived = archive_votes(snapshot, archive_dir) if archive_dir else 0
+        yield snapshot, archived
@@ -0,0 +1,110 @@
+"""Cached snapshot of a poll's dates and choices for vote validation."""
+import math
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import results_cache
+from .models import Choice, Question
+
+
+def state_key(question_id):
+    """Return the cache key of a question state."""
+    return f"polls:state:{question_id}"
+
+
+class PollState:
+    """Question text, voting window and choices of a poll.
+
+    The snapshot is valid until expires_at, the next publication or end
+    date after it was taken, so can_vote() answers like the question
+    would without another query.
+    """
+
+    def __init__(self, question_id, question_text, pub_date, end_date, choices, now=None):
+        """Keep the question fields and a dict of choice id to choice text."""
+        self.id = question_id
+        self.question_text = question_text
+        self.pub_date = pub_date
+        self.end_date = end_date
+        self.choices = choices
+        now = now or timezone.now()
+        self.expires_at = min((date for date in (pub_date, end_date)
+                               if date is not None and date > now), default=None)
+
+    def is_expired(self, now=None):
+        """Return whether a publication or end date was passed since the snapshot."""
+        return self.expires_at is not None and (now or timezone.now()) >= self.expires_at
+
+    def is_published(self, now=None):
+        """Return whether the poll is published, like Question.is_published."""
+        return self.pub_date <= (now or timezone.now())
+
+    def can_vote(self, now=None):
+        """Return whether the poll is open, like Question.can_vote."""
+        now = now or timezone.now()
+        return self.pub_date <= now and (self.end_date is None or now <= self.end_date)
+
+
+def load_poll_state(question_id):
+    """Read the state of a question with its choices in one query.
+
+    Raises:
+        Question.DoesNotExist: if there is no question with this id.
+    """
+    rows = list(Question.objects.filter(pk=question_id).order_by("choice__id").values_list(
+        "question_text", "pub_date", "end_date", "choice__id", "choice__choice_text"))
+    if not rows:
+        raise Question.DoesNotExist(f"No question with id {question_id}.")
+    question_text, pub_date, end_date = rows[0][:3]
+    choices = {choice_id: choice_text for *_, choice_id, choice_text in rows
+               if choice_id is not None}
+    return PollState(question_id, question_text, pub_date, end_date, choices)
+
+
+def poll_state(question_id):
+    """Return the state of a question, from the cache when still valid.
+
+    The entry times out at the next publication or end date of the
+    question, and at the latest after the cache default timeout. Edits
+    drop the entry through signals in the process that made them, so
+    other workers only see an edit at once with a shared results cache
+    (RESULTS_CACHE_BACKEND=file on one host, or db). With locmem they see it
+    after the timeout.
+
+    Raises:
+        Question.DoesNotExist: if there is no question with this id.
+    """
+    cache = results_cache()
+    key = state_key(question_id)
+    state = cache.get(key)
+    if state is not None and not state.is_expired():
+        return state
+    state = load_poll_state(question_id)
+    timeout = cache.default_timeout
+    if state.expires_at is not None:
+        seconds = (state.expires_at - timezone.now()).total_seconds()
+        timeout = max(1, min(math.ceil(seconds), timeout))
+    cache.set(key, state, timeout=timeout)
+    return state
+
+
+def invalidate_poll_state(question_id):
+    """Drop the cached state of a question once the transaction commits."""
+    transaction.on_commit(lambda: results_cache().delete(state_key(question_id)))
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_state_on_question_change(sender, instance, **kwargs):
+    """Invalidate the state when a question dates or text change."""
+    invalidate_poll_state(instance.pk)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def invalidate_state_on_choice_change(sender, instance, **kwargs):
+    """Invalidate the state when a choice is added, edited or deleted."""
+    invalidate_poll_state(instance.question_id)
@@ -1,11 +1,45 @@
 import datetime
+import gzip
+import json
+import logging
+import logging.config
+import os
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
-from django.urls import reverse
+from django.urls import include, path, reverse
 from django.contrib.auth.models import User
 
-from .models import Question
+from mysite import urls as project_urls
+from mysite.logging_utils import JsonFormatter, QueueListenerHandler, SamplingFilter
+
+from .api import results_poller, tally_changes
+from .archive import move_votes
+from .benchmark import ClientTarget, ServerSampler, summarize
+from .cache import cache_stats, cached_results, results_cache
+from .export import export_lines
+from .importer import VoteImporter, read_json_array, read_records
+from .ingest import VoteBuffer, lock_voters, upsert_votes, vote_buffer, write_votes
+from .management.commands.benchmark_polls import Command as BenchmarkCommand
+from .metrics import percentile
+from .models import ArchivedVote, Choice, Question, ResultsSnapshot, Vote
+from .pagecache import index_timeout
+from .pagination import KeysetPaginator
+from .seeding import seed_polls, vote_shares
+from .snapshots import archive_path, take_snapshot
+from .state import poll_state
+from .timing import request_metrics
+from .urls import poll_urlpatterns
 
 
 def create_question(question_text, days):
@@ -69,6 +103,10 @@ class QuestionIndexViewTests(TestCase):
     """
     Test on Index page displaying the correct polls.
     """
+    def setUp(self):
+        """Start with no cached pages."""
+        results_cache().clear()
+
     def test_no_questions(self):
         """
         If no questions exist, an appropriate message is displayed.
@@ -126,6 +164,65 @@ class QuestionIndexViewTests(TestCase):
         )
 
 
+@override_settings(POLLS_INDEX_PAGE_SIZE=2)
+class QuestionIndexPaginationTests(TestCase):
+    """
+    Test index page show one keyset page of polls with cursors
+    to the older and newer pages.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create five published questions, newest is question 4."""
+        cls.questions = [create_question(f"Question {n}", days=n - 10) for n in range(5)]
+
+    def setUp(self):
+        """Start with no cached pages."""
+        results_cache().clear()
+
+    def test_first_page(self):
+        """First page show the newest questions and only a next cursor."""
+        response = self.client.get(reverse("polls:index"))
+        self.assertEqual(list(response.context["latest_question_list"]),
+                         [self.questions[4], self.questions[3]])
+        self.assertIsNotNone(response.context["next_cursor"])
+        self.assertIsNone(response.context["previous_cursor"])
+
+    def test_walk_forward_and_back(self):
+        """Following next then previous cursors return to the same pages."""
+        url = reverse("polls:index")
+        first = self.client.get(url)
+        second = self.client.get(url, {"after": first.context["next_cursor"]})
+        third = self.client.get(url, {"after": second.context["next_cursor"]})
+        self.assertEqual(list(second.context["latest_question_list"]),
+                         [self.questions[2], self.questions[1]])
+        self.assertEqual(list(third.context["latest_question_list"]), [self.questions[0]])
+        self.assertIsNone(third.context["next_cursor"])
+        back = self.client.get(url, {"before": third.context["previous_cursor"]})
+        self.assertEqual(list(back.context["latest_question_list"]),
+                         list(second.context["latest_question_list"]))
+        back = self.client.get(url, {"before": back.context["previous_cursor"]})
+        self.assertEqual(list(back.context["latest_question_list"]),
+                         list(first.context["latest_question_list"]))
+        self.assertIsNone(back.context["previous_cursor"])
+
+    def test_invalid_cursor_show_first_page(self):
+        """A broken cursor fall back to the first page."""
+        response = self.client.get(reverse("polls:index"), {"after": "not-a-cursor"})
+        self.assertEqual(list(response.context["latest_question_list"]),
+                         [self.questions[4], self.questions[3]])
+
+    def test_poll_status_from_query(self):
+        """Open and closed status come annotated from the query."""
+        closed = self.questions[4]
+        closed.end_date = timezone.now() - datetime.timedelta(days=1)
+        closed.save()
+        response = self.client.get(reverse("polls:index"))
+        statuses = [question.is_open for question in response.context["latest_question_list"]]
+        self.assertEqual(statuses, [False, True])
+        self.assertContains(response, "Question 4 --Poll end!!!")
+
+
 class QuestionDetailViewTests(TestCase):
     """
     Test on detail page showing correct poll question detail, and not showing future poll.
@@ -151,27 +248,96 @@ class QuestionDetailViewTests(TestCase):
         self.assertContains(response, past_question.question_text)
 
 
+class QuestionDetailQueryTests(TestCase):
+    """
+    Test detail page load question, choices and previous vote
+    in a fixed number of queries.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create a test user."""
+        cls.user = User.objects.create_user(username='testuser', password='testpassword')
+
+    def setUp(self):
+        """Log in the test user."""
+        self.client.force_login(self.user)
+
+    def assert_detail_queries(self, choice_count):
+        """Check the detail page of a poll with choice_count choices."""
+        question = create_question(f"Question with {choice_count} choices", days=-1)
+        choices = [create_choice(question) for _ in range(choice_count)]
+        create_vote(choices[-1], self.user)
+        # user, question, choices and previous vote, the session is cached.
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("polls:detail", args=(question.id,)))
+        self.assertEqual(response.context["previous_vote"].choice_id, choices[-1].id)
+        self.assertContains(response, 'checked=True', count=1)
+
+    def test_detail_queries_with_two_choices(self):
+        """Detail of a poll with two choices take a fixed number of queries."""
+        self.assert_detail_queries(2)
+
+    def test_detail_queries_with_many_choices(self):
+        """Detail of a poll with many choices take the same number of queries."""
+        self.assert_detail_queries(12)
+
+
+class SessionStorageTests(TestCase):
+    """Test votes do not read or write sessions or messages in the database."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create a user and a poll with two choices."""
+        cls.user = User.objects.create_user(username='testuser', password='testpassword')
+        cls.question = create_question("Question", days=-1)
+        cls.choice1 = create_choice(cls.question)
+        cls.choice2 = create_choice(cls.question)
+
+    def setUp(self):
+        """Start with empty caches and log in."""
+        results_cache().clear()
+        self.client.force_login(self.user)
+
+    def test_vote_skip_session_table(self):
+        """A vote and the results page with its message use no session query."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("polls:vote", args=(self.question.id,)),
+                                        {"choice": self.choice1.id}, follow=True)
+        self.assertContains(response, "success")
+        self.assertIn("messages", response.cookies)
+        self.assertFalse([query for query in queries if "django_session" in query["sql"]])
+
+
 class QuestionResultsTest(TestCase):
     """
     Test result page show correct vote result.
     """
-    def setUp(self):
+    @classmethod
+    def setUpTestData(cls):
         """Create a test user."""
-        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        cls.user = User.objects.create_user(username='testuser', password='testpassword')
+
+    def setUp(self):
+        """Start with an empty results cache."""
+        results_cache().clear()
 
     def test_result_from_voted_question(self):
         """
         The results view of a question that have been voted on is display
         """
         question = create_question("Question", days=0)
+        # a user can vote once per question, so each vote need its own user.
+        voters = [User.objects.create_user(username=f'voter{n}', password='testpassword')
+                  for n in range(5)]
         choice1 = create_choice(question)
         c1_vote1 = create_vote(choice1, self.user)
-        c1_vote2 = create_vote(choice1, self.user)
+        c1_vote2 = create_vote(choice1, voters[0])
         choice2 = create_choice(question)
-        c2_vote1 = create_vote(choice2, self.user)
-        c2_vote2 = create_vote(choice2, self.user)
-        c2_vote3 = create_vote(choice2, self.user)
-        c2_vote4 = create_vote(choice2, self.user)
+        c2_vote1 = create_vote(choice2, voters[1])
+        c2_vote2 = create_vote(choice2, voters[2])
+        c2_vote3 = create_vote(choice2, voters[3])
+        c2_vote4 = create_vote(choice2, voters[4])
 
         response = self.client.get(reverse("polls:results", args=(question.id,)))
         self.assertContains(response, f"{choice1.choice_text}")
@@ -182,15 +348,129 @@ class QuestionResultsTest(TestCase):
         self.assertEqual(choice2.votes, 4)
 
 
+class ResultsViewQueryTests(TestCase):
+    """
+    Test the results page cost a fixed number of queries
+    no matter how many choices a poll has.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create voters for the polls."""
+        cls.users = [User.objects.create_user(username=f'voter{n}', password='testpassword')
+                     for n in range(3)]
+
+    def setUp(self):
+        """Start with an empty results cache."""
+        results_cache().clear()
+
+    def assert_results_queries(self, choice_count):
+        """Create a poll with choice_count choices and check results query count."""
+        question = create_question(f"Question with {choice_count} choices", days=-1)
+        choices = [create_choice(question) for _ in range(choice_count)]
+        for user in self.users:
+            create_vote(choices[0], user)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("polls:results", args=(question.id,)))
+        self.assertEqual(len(response.context["choices"]), choice_count)
+        self.assertEqual(response.context["total_votes"], len(self.users))
+
+    def test_results_queries_with_two_choices(self):
+        """Results of a poll with two choices take one query."""
+        self.assert_results_queries(2)
+
+    def test_results_queries_with_many_choices(self):
+        """Results of a poll with many choices still take one query."""
+        self.assert_results_queries(20)
+
+    def test_results_percentages(self):
+        """Each choice get its share of the total vote."""
+        question = create_question("Question", days=-1)
+        choice1 = create_choice(question)
+        create_choice(question)
+        for user in self.users:
+            create_vote(choice1, user)
+        response = self.client.get(reverse("polls:results", args=(question.id,)))
+        percents = [choice["percent"] for choice in response.context["choices"]]
+        self.assertEqual(percents, [100.0, 0.0])
+
+    def test_results_of_missing_question(self):
+        """Results of a question that does not exist is not found."""
+        response = self.client.get(reverse("polls:results", args=(999,)))
+        self.assertEqual(response.status_code, 404)
+
+
+class ResultsCacheTests(TestCase):
+    """
+    Test results are served from the cache and dropped from it
+    when a vote is cast.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create a user and a poll with two choices."""
+        cls.user = User.objects.create_user(username='testuser', password='testpassword')
+        cls.question = create_question("Question", days=-1)
+        cls.choice1 = create_choice(cls.question)
+        cls.choice2 = create_choice(cls.question)
+        cls.url = reverse("polls:results", args=(cls.question.id,))
+
+    def setUp(self):
+        """Start with an empty results cache."""
+        results_cache().clear()
+
+    @override_settings(RESULTS_CACHE_STATS=True)
+    def test_second_request_hit_cache(self):
+        """The second results lookup use no query and count as a hit."""
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            cached_results(self.question.id)
+        self.assertEqual(cache_stats(), {"hits": 1, "misses": 1})
+
+    @override_settings(RESULTS_CACHE_STATS=False)
+    def test_lookups_not_counted_when_off(self):
+        """Without RESULTS_CACHE_STATS a lookup only reads the cache."""
+        cached_results(self.question.id)
+        with mock.patch.object(results_cache(), "add") as add:
+            cached_results(self.question.id)
+        add.assert_not_called()
+        self.assertEqual(cache_stats(), {"hits": 0, "misses": 0})
+
+    def test_vote_invalidate_results(self):
+        """A vote drop the cached results so the next request show it."""
+        self.client.get(self.url)
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("polls:vote", args=(self.question.id,)),
+                             {"choice": self.choice2.id})
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["total_votes"], 1)
+        self.assertEqual(response.context["choices"][1]["votes"], 1)
+
+    @override_settings(RESULTS_CACHE_STATS=True)
+    def test_results_cache_stats_command(self):
+        """results_cache_stats print the counters."""
+        self.client.get(self.url)
+        out = StringIO()
+        call_command("results_cache_stats", "--reset", stdout=out)
+        self.assertIn("misses: 1", out.getvalue())
+        self.assertEqual(cache_stats(), {"hits": 0, "misses": 0})
+
+
 class VoteTests(TestCase):
     """
     Test of vote feature. Vote increase after being vote, vote redirect to result page after voting,
     vote without selected choice don't go through.
     """
 
-    def setUp(self):
+    @classmethod
+    def setUpTestData(cls):
         """Create a test user."""
-        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        cls.user = User.objects.create_user(username='testuser', password='testpassword')
+
+    def setUp(self):
+        """Start with an empty poll state cache."""
+        results_cache().clear()
 
     def test_vote_choice(self):
         """
@@ -233,6 +513,37 @@ class VoteTests(TestCase):
         self.assertRedirects(response, reverse("polls:results",
                                                args=(question.id,)))
 
+    def test_one_vote_per_user_per_question(self):
+        """The database refuse a second vote row by the same user on a question."""
+        question = create_question("Question", days=0)
+        choice1 = create_choice(question)
+        choice2 = create_choice(question)
+        create_vote(choice1, self.user)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Vote.objects.create(user=self.user, question=question, choice=choice2)
+
+    def test_revote_update_existing_vote(self):
+        """Voting again on a question change the existing vote."""
+        question = create_question("Question", days=0)
+        choice1 = create_choice(question)
+        choice2 = create_choice(question)
+        self.client.force_login(self.user)
+        url = reverse("polls:vote", args=(question.id,))
+        self.client.post(url, {"choice": choice1.id})
+        self.client.post(url, {"choice": choice2.id})
+        votes = Vote.objects.filter(user=self.user, question=question)
+        self.assertEqual([vote.choice_id for vote in votes], [choice2.id])
+
+    def test_vote_with_choice_of_other_question(self):
+        """A choice of another question is not a valid selection."""
+        question = create_question("Question", days=0)
+        other_choice = create_choice(create_question("Other question", days=0))
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("polls:vote", args=(question.id,)),
+                                    {"choice": other_choice.id})
+        self.assertContains(response, "You didn&#x27;t select a choice.")
+        self.assertFalse(Vote.objects.exists())
+
     def test_vote_without_selecting_choice(self):
         """
         Ensure that submitting the vote form without selecting a choice
@@ -258,6 +569,60 @@ class VoteTests(TestCase):
         self.assertTemplateUsed(response, "polls/detail.html")
 
 
+class VoteCountTests(TestCase):
+    """
+    Test the denormalized vote counter of choice follow Vote rows,
+    and sync_vote_counts command rebuild it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create a test user, a question and two choices."""
+        cls.user = User.objects.create_user(username='testuser', password='testpassword')
+        cls.question = create_question("Question", days=-1)
+        cls.choice1 = create_choice(cls.question)
+        cls.choice2 = create_choice(cls.question)
+
+    def setUp(self):
+        """Start with an empty poll state cache."""
+        results_cache().clear()
+
+    def test_new_vote_increase_count(self):
+        """A new vote add one to its choice counter."""
+        create_vote(self.choice1, self.user)
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.vote_count, 1)
+
+    def test_changed_vote_move_count(self):
+        """Changing a vote move the count from the old choice to the new one."""
+        self.client.force_login(self.user)
+        url = reverse("polls:vote", args=(self.question.id,))
+        self.client.post(url, {"choice": self.choice1.id})
+        self.client.post(url, {"choice": self.choice2.id})
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual(self.choice1.votes, 0)
+        self.assertEqual(self.choice2.votes, 1)
+
+    def test_deleted_vote_decrease_count(self):
+        """Deleting a vote take it out of the choice counter."""
+        vote = create_vote(self.choice1, self.user)
+        vote.delete()
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.vote_count, 0)
+
+    def test_sync_vote_counts(self):
+        """sync_vote_counts --check report drift and plain run fix it."""
+        create_vote(self.choice1, self.user)
+        Choice.objects.filter(pk=self.choice1.pk).update(vote_count=5)
+        with self.assertRaises(CommandError):
+            call_command("sync_vote_counts", "--check", stdout=StringIO())
+        call_command("sync_vote_counts", stdout=StringIO())
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.vote_count, Vote.objects.filter(choice=self.choice1).count())
+        call_command("sync_vote_counts", "--check", stdout=StringIO())
+
+
 class QuestionIsPublished(TestCase):
     """
     Test is_published method in Question Model.
@@ -303,3 +668,913 @@ class TestCanVote(TestCase):
         question = create_question("End question", days=-5)
         question.end_date = timezone.now()-datetime.timedelta(days=1)
         self.assertFalse(question.can_vote())
+
+
+class AdminTests(TestCase):
+    """Test the question and vote admin pages."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create a superuser and a poll with one vote."""
+        cls.admin = User.objects.create_superuser(username='admin', password='testpassword')
+        cls.question = create_question("Question", days=-1)
+        cls.choice = create_choice(cls.question)
+        create_vote(cls.choice, cls.admin)
+
+    def setUp(self):
+        """Log in the superuser."""
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self):
+        """Return the number of queries of the question changelist."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("admin:polls_question_changelist"))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_question_changelist_queries_do_not_grow(self):
+        """Status and vote totals do not add queries per row."""
+        queries = self.changelist_queries()
+        for n in range(10):
+            create_choice(create_question(f"Question {n}", days=-n))
+        self.assertEqual(self.changelist_queries(), queries)
+
+    def test_question_changelist_annotations(self):
+        """Rows carry the status and vote total computed in SQL."""
+        response = self.client.get(reverse("admin:polls_question_changelist"))
+        question = response.context["cl"].result_list[0]
+        self.assertTrue(question.published)
+        self.assertTrue(question.is_open)
+        self.assertEqual(question.vote_total, 1)
+
+    def test_status_filter(self):
+        """Questions can be filtered by status."""
+        create_question("Scheduled", days=5)
+        url = reverse("admin:polls_question_changelist")
+        response = self.client.get(url, {"status": "scheduled"})
+        self.assertEqual([question.question_text for question in response.context["cl"].result_list],
+                         ["Scheduled"])
+
+    def test_vote_admin_is_read_only(self):
+        """Votes can be listed but not added or changed."""
+        self.assertEqual(self.client.get(reverse("admin:polls_vote_changelist")).status_code, 200)
+        self.assertEqual(self.client.get(reverse("admin:polls_vote_add")).status_code, 403)
+        vote = Vote.objects.get()
+        response = self.client.get(reverse("admin:polls_vote_change", args=(vote.id,)))
+        self.assertNotContains(response, 'name="_save"')
+
+    def test_delete_question_with_votes(self):
+        """Deleting a question from the admin also deletes its votes."""
+        response = self.client.post(reverse("admin:polls_question_delete", args=(self.question.id,)),
+                                    {"post": "yes"})
+        self.assertRedirects(response, reverse("admin:polls_question_changelist"))
+        self.assertFalse(Vote.objects.exists())
+
+
+class BenchmarkTests(TestCase):
+    """Test seeding and statistics helpers of the benchmark suite."""
+
+    def test_percentile(self):
+        """Percentiles use the nearest rank."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_summarize(self):
+        """Summary count requests, errors and average queries."""
+        samples = [(0.010, 3, 200), (0.020, 5, 302), (0.030, None, 500)]
+        summary = summarize(samples, elapsed=0.5)
+        self.assertEqual(summary["requests"], 3)
+        self.assertEqual(summary["errors"], 1)
+        self.assertEqual(summary["requests_per_second"], 6.0)
+        self.assertEqual(summary["p50_ms"], 20.0)
+        self.assertEqual(summary["queries_per_request"], 4.0)
+
+    def test_seed_polls(self):
+        """Seeding create the rows asked for with counters matching votes."""
+        created = seed_polls(users=5, questions=3, choices=2, votes=12, seed=1, batch_size=4)
+        self.assertEqual(created, {"users": 5, "questions": 3, "choices": 6, "votes": 12})
+        self.assertEqual(Choice.objects.count(), 6)
+        self.assertEqual(Vote.objects.count(), 12)
+        for choice in Choice.objects.all():
+            self.assertEqual(choice.vote_count, choice.vote_set.count())
+
+    def test_zipf_shares(self):
+        """Zipf shares add up to the total and favour the first items."""
+        shares = list(vote_shares(4, 100, "zipf"))
+        self.assertEqual(sum(shares), 100)
+        self.assertEqual(shares, sorted(shares, reverse=True))
+        self.assertEqual(list(vote_shares(3, 10)), [3, 4, 3])
+
+    def test_seed_polls_command(self):
+        """seed_polls command create data and refuse a used prefix."""
+        call_command("seed_polls", "--users", "4", "--questions", "2", "--votes", "6",
+                     stdout=StringIO())
+        self.assertEqual(Vote.objects.count(), 6)
+        with self.assertRaises(CommandError):
+            call_command("seed_polls", "--users", "1", stdout=StringIO())
+
+    def test_benchmark_reuse_seeded_data(self):
+        """A second run with the same random seed reuses the seeded users."""
+        options = {"random_seed": 3, "seed_users": 2, "seed_questions": 1,
+                   "seed_choices": 2, "seed_votes": 2}
+        command = BenchmarkCommand(stdout=StringIO())
+        command.seed(options)
+        command.seed(options)
+        self.assertEqual(User.objects.filter(username__startswith="bench3-").count(), 2)
+        self.assertIn("already seeded", command.stdout.getvalue())
+
+    def test_client_login_failure_raised(self):
+        """A client that cannot log in fails instead of running anonymously."""
+        user = User.objects.create_user(username='bench', password='testpassword')
+        with mock.patch("polls.benchmark.Client.force_login", side_effect=OperationalError), \
+                mock.patch("polls.benchmark.time.sleep"):
+            with self.assertRaises(OperationalError):
+                ClientTarget(user)
+
+    def test_server_sampler(self):
+        """The sampler reports peak memory and threads of a process."""
+        with ServerSampler(os.getpid(), interval=0.01) as sampler:
+            pass
+        stats = sampler.stats()
+        self.assertGreater(stats["peak_rss_mb"], 0)
+        self.assertGreaterEqual(stats["peak_threads"], 1)
+
+
+class ExportTests(TestCase):
+    """Test streaming export of results and votes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create a staff user, a poll and one vote."""
+        cls.staff = User.objects.create_user(username='staff', password='testpassword', is_staff=True)
+        cls.question = create_question("Question", days=-1)
+        cls.choice = create_choice(cls.question)
+        create_vote(cls.choice, cls.staff)
+
+    def test_export_results_csv(self):
+        """Staff get the per choice results as streamed CSV."""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("polls:export", args=(self.question.id,)))
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ["choice_id,choice_text,votes", f"{self.choice.id},Choice 1,1"])
+
+    def test_export_votes_ndjson(self):
+        """Staff get raw votes as NDJSON."""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("polls:export", args=(self.question.id,)),
+                                   {"kind": "votes", "format": "ndjson"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn('"username": "staff"', content)
+
+    async def test_export_votes_under_asgi(self):
+        """Under ASGI the lines are streamed from an async iterator."""
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse("polls:export", args=(self.question.id,)),
+                                               {"kind": "votes"})
+        self.assertTrue(response.is_async)
+        lines = b"".join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual(lines[0], "vote_id,user_id,username,choice_id")
+        self.assertIn("staff", lines[1])
+
+    def test_export_need_staff(self):
+        """A user who is not staff cannot export."""
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(user)
+        response = self.client.get(reverse("polls:export", args=(self.question.id,)))
+        self.assertEqual(response.status_code, 302)
+
+    def test_export_results_command(self):
+        """export_results command write votes to standard output."""
+        out = StringIO()
+        call_command("export_results", str(self.question.id), "--kind", "votes", stdout=out)
+        self.assertIn("vote_id,user_id,username,choice_id", out.getvalue())
+        self.assertIn("staff", out.getvalue())
+
+
+class SnapshotTests(TestCase):
+    """Test results snapshots of closed polls and archival of their votes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create an ended poll with two votes and an open poll."""
+        cls.closed = create_question("Closed", days=-3)
+        cls.closed.end_date = timezone.now() - datetime.timedelta(days=1)
+        cls.closed.save()
+        cls.choice1 = create_choice(cls.closed)
+        cls.choice2 = create_choice(cls.closed)
+        cls.user1 = User.objects.create_user(username='user1', password='testpassword')
+        cls.user2 = User.objects.create_user(username='user2', password='testpassword')
+        create_vote(cls.choice1, cls.user1)
+        create_vote(cls.choice2, cls.user2)
+        cls.open = create_question("Open", days=-1)
+
+    def setUp(self):
+        """Start with an empty cache."""
+        results_cache().clear()
+
+    def test_sweep_take_closed_polls_once(self):
+        """Only ended polls are taken, and only once."""
+        out = StringIO()
+        call_command("snapshot_results", stdout=out)
+        self.assertIn("Took 1 snapshot(s).", out.getvalue())
+        snapshot = ResultsSnapshot.objects.get()
+        self.assertEqual(snapshot.question, self.closed)
+        self.assertEqual(snapshot.total, 2)
+        call_command("snapshot_results", stdout=out)
+        self.assertIn("Took 0 snapshot(s).", out.getvalue())
+
+    def test_results_served_from_snapshot(self):
+        """Final results are read from the snapshot in one query and cached."""
+        take_snapshot(self.closed)
+        with self.assertNumQueries(1):
+            results = cached_results(self.closed.id)
+        self.assertTrue(results["final"])
+        self.assertEqual([choice["votes"] for choice in results["choices"]], [1, 1])
+        with self.assertNumQueries(0):
+            cached_results(self.closed.id)
+        response = self.client.get(reverse("polls:results-json", args=(self.closed.id,)))
+        self.assertTrue(response.json()["final"])
+
+    def test_reopened_poll_drops_snapshot(self):
+        """Moving the end date to the future drops the snapshot."""
+        take_snapshot(self.closed)
+        self.closed.end_date = timezone.now() + datetime.timedelta(days=1)
+        self.closed.save()
+        self.assertFalse(ResultsSnapshot.objects.exists())
+        self.assertFalse(cached_results(self.closed.id)["final"])
+
+    def test_archive_votes(self):
+        """Archived votes are in the file and their counts stay in the results."""
+        with tempfile.TemporaryDirectory() as directory:
+            call_command("snapshot_results", "--archive-dir", directory, stdout=StringIO())
+            with gzip.open(archive_path(directory, self.closed.id), "rt") as archive:
+                lines = archive.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertFalse(Vote.objects.filter(question=self.closed).exists())
+        self.assertEqual(Choice.objects.get(pk=self.choice1.pk).vote_count, 1)
+        self.assertEqual(cached_results(self.closed.id)["total"], 2)
+        # counters of archived polls are not recounted.
+        call_command("sync_vote_counts", "--check", stdout=StringIO())
+        take_snapshot(self.closed)
+        self.assertEqual(ResultsSnapshot.objects.get().total, 2)
+
+    def test_retake_open_poll_fails(self):
+        """Only closed questions can be taken again."""
+        with self.assertRaises(CommandError):
+            call_command("snapshot_results", "--question", str(self.open.id), stdout=StringIO())
+
+
+class ArchiveTests(TestCase):
+    """Test moving votes of long closed polls to the archive table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create a poll closed 60 days ago with three votes and a recently closed poll."""
+        cls.old = create_question("Old", days=-90)
+        cls.old.end_date = timezone.now() - datetime.timedelta(days=60)
+        cls.old.save()
+        cls.choice1 = create_choice(cls.old)
+        cls.choice2 = create_choice(cls.old)
+        cls.users = [User.objects.create_user(username=f'user{i}', password='testpassword')
+                     for i in range(3)]
+        for user, choice in zip(cls.users, (cls.choice1, cls.choice1, cls.choice2)):
+            create_vote(choice, user)
+        cls.recent = create_question("Recent", days=-10)
+        cls.recent.end_date = timezone.now() - datetime.timedelta(days=1)
+        cls.recent.save()
+        create_vote(create_choice(cls.recent), cls.users[0])
+
+    def setUp(self):
+        """Start with an empty cache."""
+        results_cache().clear()
+
+    def test_archive_old_polls_in_chunks(self):
+        """Votes of polls closed long enough move, results and counters stay."""
+        out = StringIO()
+        call_command("archive_votes", "--chunk-size", "2", stdout=out)
+        self.assertIn("Archived 3 votes of 1 poll(s)", out.getvalue())
+        self.assertFalse(Vote.objects.filter(question=self.old).exists())
+        self.assertEqual(ArchivedVote.objects.filter(question=self.old).count(), 3)
+        self.assertEqual(Vote.objects.filter(question=self.recent).count(), 1)
+        results = cached_results(self.old.id)
+        self.assertTrue(results["final"])
+        self.assertEqual([choice["votes"] for choice in results["choices"]], [2, 1])
+        call_command("sync_vote_counts", "--check", stdout=StringIO())
+
+    def test_resume_after_interruption(self):
+        """A run stopped after one chunk is finished by the next run."""
+        self.assertEqual(move_votes(self.old.id, chunk_size=2), 2)
+        call_command("archive_votes", stdout=StringIO())
+        self.assertEqual(ArchivedVote.objects.count(), 3)
+        self.assertEqual(Choice.objects.get(pk=self.choice1.pk).vote_count, 2)
+
+    def test_reopen_keeps_snapshot(self):
+        """A poll whose votes moved to the archive keeps its snapshot when reopened."""
+        call_command("archive_votes", stdout=StringIO())
+        self.assertIsNotNone(ResultsSnapshot.objects.get(question=self.old).votes_archived_at)
+        self.old.end_date = timezone.now() + datetime.timedelta(days=1)
+        self.old.save()
+        self.assertTrue(ResultsSnapshot.objects.filter(question=self.old).exists())
+        self.assertEqual(cached_results(self.old.id)["total"], 3)
+
+    def test_deleting_user_uncounts_archived_votes(self):
+        """Archived votes deleted with their user leave the counters."""
+        call_command("archive_votes", stdout=StringIO())
+        self.users[0].delete()
+        self.assertEqual(Choice.objects.get(pk=self.choice1.pk).vote_count, 1)
+        call_command("sync_vote_counts", "--check", stdout=StringIO())
+
+    def test_export_include_archived_votes(self):
+        """Vote exports read the archive as well."""
+        move_votes(self.old.id, chunk_size=1)
+        lines = list(export_lines(self.old.id, kind="votes"))
+        self.assertEqual(len(lines), 4)
+
+
+class ImportVotesTests(TestCase):
+    """Test streaming vote import."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create two users and a poll with two choices."""
+        cls.alice = User.objects.create_user(username='alice', password='testpassword')
+        cls.bob = User.objects.create_user(username='bob', password='testpassword')
+        cls.question = create_question("Question", days=-1)
+        cls.first = create_choice(cls.question)
+        cls.second = create_choice(cls.question)
+
+    def test_read_json_array_across_buffers(self):
+        """Items cut by the read size are still parsed."""
+        items = [{"fields": {"user": n, "choice": n * 2}} for n in range(50)]
+        self.assertEqual(list(read_json_array(StringIO(json.dumps(items)), read_size=7)), items)
+        with self.assertRaises(ValueError):
+            list(read_json_array(StringIO('[{"user": 1}, {"us'), read_size=7))
+
+    def test_read_json_array_malformed_item(self):
+        """A malformed item fails without reading the rest of the stream."""
+        stream = StringIO('[{"user": 1}, {"user": 2,, "choice": 3}, ' + '{"user": 4}, ' * 1000 + ']')
+        with self.assertRaisesMessage(ValueError, "Invalid JSON array item"):
+            list(read_json_array(stream, read_size=64))
+        self.assertLess(stream.tell(), 200)
+
+    def test_read_json_array_number_across_buffers(self):
+        """A number cut by the read size is read whole."""
+        self.assertEqual(list(read_json_array(StringIO("[12345, 678]"), read_size=4)), [12345, 678])
+
+    def test_non_object_items_skipped(self):
+        """Array items that are not objects are counted as skipped."""
+        records = read_records(StringIO(json.dumps([1, "vote", {"user": self.alice.id, "choice": self.first.id}])),
+                               "json")
+        importer = VoteImporter()
+        importer.import_records(records)
+        self.assertEqual((importer.read, importer.written, importer.skipped), (3, 1, 2))
+
+    def test_import_fixture(self):
+        """Fixture votes are imported with one vote per user and question."""
+        votes = [
+            {"model": "polls.vote", "pk": 1, "fields": {"user": self.alice.id, "choice": self.first.id}},
+            {"model": "polls.vote", "pk": 2, "fields": {"user": self.alice.id, "choice": self.second.id}},
+            {"model": "polls.vote", "pk": 3, "fields": {"user": self.bob.id, "choice": self.first.id}},
+            {"model": "polls.vote", "pk": 4, "fields": {"user": 999, "choice": self.first.id}},
+        ]
+        importer = VoteImporter(batch_size=2)
+        importer.import_records(read_records(StringIO(json.dumps(votes)), "json"))
+        self.assertEqual((importer.read, importer.written, importer.replaced, importer.skipped),
+                         (4, 2, 1, 1))
+        self.assertEqual(Vote.objects.get(user=self.alice).choice, self.second)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.votes, self.second.votes), (1, 1))
+
+    def test_import_exported_csv(self):
+        """A votes export can be imported back, matching users by name."""
+        create_vote(self.first, self.alice)
+        create_vote(self.second, self.bob)
+        exported = "".join(export_lines(self.question.id, "votes", "csv"))
+        Vote.objects.all().delete()
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as export_file:
+            export_file.write(exported)
+        self.addCleanup(os.remove, export_file.name)
+        out = StringIO()
+        call_command("import_votes", export_file.name, "--skip-existing", stdout=out)
+        self.assertIn("wrote 2 votes", out.getvalue())
+        self.assertEqual(Vote.objects.get(user=self.bob).choice, self.second)
+
+
+@override_settings(POLLS_VOTE_INGESTION="buffered", POLLS_VOTE_FLUSH_INTERVAL=0)
+class BufferedVoteTests(TestCase):
+    """Test buffered vote ingestion, flushed by hand."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create a user and a poll with two choices."""
+        cls.user = User.objects.create_user(username='testuser', password='testpassword')
+        cls.question = create_question("Question", days=-1)
+        cls.first = create_choice(cls.question)
+        cls.second = create_choice(cls.question)
+
+    def setUp(self):
+        """Start with an empty cache and a private buffer."""
+        results_cache().clear()
+        self.buffer = VoteBuffer()
+
+    def tearDown(self):
+        """Drop votes left in the shared buffer."""
+        vote_buffer.flush()
+
+    def test_flush_write_votes_and_counts(self):
+        """Flush upsert the last vote of each user and move the counters."""
+        other = User.objects.create_user(username='other', password='testpassword')
+        create_vote(self.first, self.user)
+        self.buffer.submit(self.user.id, self.question.id, self.second.id)
+        self.buffer.submit(other.id, self.question.id, self.first.id)
+        self.buffer.submit(other.id, self.question.id, self.second.id)
+        self.assertEqual(self.buffer.stats()["depth"], 2)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(Vote.objects.get(user=self.user).choice, self.second)
+        self.assertEqual(Vote.objects.get(user=other).choice, self.second)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.votes, self.second.votes), (0, 2))
+        self.assertEqual(self.buffer.stats()["depth"], 0)
+
+    def test_full_buffer_reject_votes(self):
+        """A full buffer refuse new votes so they are written directly."""
+        with self.settings(POLLS_VOTE_QUEUE_SIZE=1):
+            self.assertTrue(self.buffer.submit(self.user.id, self.question.id, self.first.id))
+            self.assertFalse(self.buffer.submit(self.user.id + 1, self.question.id, self.first.id))
+        self.assertEqual(self.buffer.stats()["rejected"], 1)
+
+    def test_voter_see_buffered_vote(self):
+        """A vote not flushed yet is checked on the detail page."""
+        self.client.force_login(self.user)
+        self.client.post(reverse("polls:vote", args=(self.question.id,)), {"choice": self.second.id})
+        self.assertFalse(Vote.objects.exists())
+        response = self.client.get(reverse("polls:detail", args=(self.question.id,)))
+        self.assertEqual(response.context["previous_vote"].choice_id, self.second.id)
+        vote_buffer.flush()
+        self.assertEqual(Vote.objects.get(user=self.user).choice, self.second)
+
+    def test_rejected_vote_is_dead_lettered(self):
+        """A vote the database keeps rejecting is dropped without blocking the others."""
+        other = User.objects.create_user(username='other', password='testpassword')
+
+        def reject_user(votes):
+            if any(user_id == self.user.id for user_id, _, _ in votes):
+                raise IntegrityError("rejected")
+            write_votes(votes)
+
+        self.buffer.submit(self.user.id, self.question.id, self.first.id)
+        self.buffer.submit(other.id, self.question.id, self.second.id)
+        with mock.patch("polls.ingest.write_votes", side_effect=reject_user), \
+                self.settings(POLLS_VOTE_MAX_ATTEMPTS=2):
+            self.assertEqual(self.buffer.flush(), 1)
+            self.assertEqual(self.buffer.pending_choice(self.user.id, self.question.id), self.first.id)
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(Vote.objects.get().user, other)
+        self.assertEqual(self.buffer.stats()["depth"], 0)
+        self.assertEqual(self.buffer.stats()["dead_lettered"], 1)
+        self.assertEqual(self.buffer.dead_letters[0]["choice_id"], self.first.id)
+
+
+class PollStateTests(TestCase):
+    """Test the cached poll state used to validate votes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create a poll with one choice."""
+        cls.question = create_question("Question", days=-1)
+        cls.choice = create_choice(cls.question)
+
+    def setUp(self):
+        """Start with an empty cache."""
+        results_cache().clear()
+
+    def test_state_is_cached(self):
+        """The state is read in one query, then from the cache."""
+        with self.assertNumQueries(1):
+            state = poll_state(self.question.id)
+        self.assertEqual(state.choices, {self.choice.id: "Choice 1"})
+        self.assertTrue(state.can_vote())
+        with self.assertNumQueries(0):
+            poll_state(self.question.id)
+
+    def test_state_expire_at_end_date(self):
+        """A snapshot of an open poll expire when the poll end."""
+        end_date = timezone.now() + datetime.timedelta(hours=1)
+        Question.objects.filter(pk=self.question.id).update(end_date=end_date)
+        state = poll_state(self.question.id)
+        self.assertEqual(state.expires_at, end_date)
+        self.assertTrue(state.can_vote())
+        later = end_date + datetime.timedelta(seconds=1)
+        self.assertTrue(state.is_expired(later))
+        self.assertFalse(state.can_vote(later))
+
+    def test_state_timeout_capped(self):
+        """A poll ending months away is not cached past the cache default timeout."""
+        Question.objects.filter(pk=self.question.id).update(
+            end_date=timezone.now() + datetime.timedelta(days=90))
+        cache = results_cache()
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            poll_state(self.question.id)
+        self.assertEqual(cache_set.call_args.kwargs["timeout"], cache.default_timeout)
+
+    def test_state_invalidated_on_save(self):
+        """Saving the question or a choice drop the snapshot."""
+        poll_state(self.question.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_choice(self.question)
+        self.assertEqual(len(poll_state(self.question.id).choices), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.end_date = timezone.now() - datetime.timedelta(minutes=1)
+            self.question.save()
+        self.assertFalse(poll_state(self.question.id).can_vote())
+
+    def test_receivers_connected_without_urlconf(self):
+        """Commands and shells, which never load the views, invalidate cached state too."""
+        script = ("import sys, django; django.setup(); "
+                  "print('polls.state' in sys.modules and 'polls.cache' in sys.modules, "
+                  "'polls.views' in sys.modules)")
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                check=True, env=dict(os.environ, DJANGO_SETTINGS_MODULE="mysite.test_settings"))
+        self.assertEqual(output.stdout.split(), ["True", "False"])
+
+    def test_vote_validate_without_reading_question(self):
+        """With a cached state, a vote only query to write itself."""
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(user)
+        poll_state(self.question.id)
+        url = reverse("polls:vote", args=(self.question.id,))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url, {"choice": self.choice.id})
+        self.assertFalse(any('FROM "polls_question"' in query["sql"] for query in queries))
+        self.assertEqual(Vote.objects.get(user=user).choice, self.choice)
+
+    def test_vote_queries(self):
+        """A new or changed vote is one upsert and one counter update."""
+        other = create_choice(self.question)
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(user)
+        poll_state(self.question.id)
+        url = reverse("polls:vote", args=(self.question.id,))
+        for choice in (self.choice, other):
+            # user, savepoint, voter lock, previous vote, upsert, counters, release.
+            with self.assertNumQueries(7):
+                self.client.post(url, {"choice": choice.id})
+        self.assertEqual(Vote.objects.get(user=user).choice, other)
+        self.assertEqual(Choice.objects.get(pk=self.choice.pk).vote_count, 0)
+        self.assertEqual(Choice.objects.get(pk=other.pk).vote_count, 1)
+
+    def test_concurrent_first_vote_counted_once(self):
+        """A first vote committed while waiting for the voter lock is read as the previous vote."""
+        user = User.objects.create_user(username='testuser', password='testpassword')
+
+        def other_request_commits_first(user_ids):
+            # the double-submitted vote won the lock and committed.
+            Vote.objects.create(user=user, question=self.question, choice=self.choice)
+            lock_voters(user_ids)
+
+        with mock.patch("polls.ingest.lock_voters", side_effect=other_request_commits_first):
+            previous = upsert_votes([(user.id, self.question.id, self.choice.id)])
+        self.assertEqual(previous, {(user.id, self.question.id): self.choice.id})
+        self.assertEqual(Vote.objects.filter(user=user).count(), 1)
+        self.assertEqual(Choice.objects.get(pk=self.choice.pk).vote_count, 1)
+
+
+class PageCacheTests(TestCase):
+    """Test full-page caching of the index and results pages."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create a user and a poll with a choice."""
+        cls.question = create_question("Question", days=-1)
+        cls.choice = create_choice(cls.question)
+        cls.user = User.objects.create_user(username='testuser', password='testpassword')
+
+    def setUp(self):
+        """Start with an empty cache."""
+        results_cache().clear()
+
+    def test_anonymous_page_served_from_cache(self):
+        """The second anonymous request use no query."""
+        url = reverse("polls:index")
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first["ETag"], second["ETag"])
+        self.assertIn("Cookie", second["Vary"])
+
+    def test_conditional_get(self):
+        """A matching ETag or Last-Modified get a 304 without a body."""
+        url = reverse("polls:results", args=(self.question.id,))
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        not_modified = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+
+    def test_vote_invalidate_results_page(self):
+        """A vote give the results page a new version."""
+        url = reverse("polls:results", args=(self.question.id,))
+        etag = self.client.get(url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            create_vote(self.choice, self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["total_votes"], 1)
+
+    def test_question_edit_invalidate_index(self):
+        """Editing a question show the change on the cached index."""
+        url = reverse("polls:index")
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.question_text = "Edited question"
+            self.question.save()
+        self.assertContains(self.client.get(url), "Edited question")
+
+    def test_index_timeout_until_next_poll_change(self):
+        """Index pages expire when a poll ends."""
+        self.question.end_date = timezone.now() + datetime.timedelta(seconds=30)
+        self.question.save()
+        self.assertLessEqual(index_timeout(), 30)
+
+    def test_logged_in_users_get_own_header(self):
+        """Logged-in users are not served the anonymous page."""
+        url = reverse("polls:index")
+        self.client.get(url)
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertContains(response, "Welcome back, testuser")
+        self.assertNotIn("ETag", response)
+
+
+class ResultsApiTests(TestCase):
+    """Test the JSON results endpoint and the live results stream."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create a user and a poll with two choices."""
+        cls.question = create_question("Question", days=-1)
+        cls.choice1 = create_choice(cls.question)
+        cls.choice2 = create_choice(cls.question)
+        cls.user = User.objects.create_user(username='testuser', password='testpassword')
+        cls.url = reverse("polls:results-json", args=(cls.question.id,))
+
+    def setUp(self):
+        """Start with an empty cache."""
+        results_cache().clear()
+
+    def test_results_json(self):
+        """Tallies are returned with their version as ETag."""
+        create_vote(self.choice2, self.user)
+        response = self.client.get(self.url)
+        data = response.json()
+        self.assertEqual(data["total"], 1)
+        self.assertEqual([choice["votes"] for choice in data["choices"]], [0, 1])
+        self.assertEqual(response["ETag"], f'"results-{self.question.id}-{data["version"]}"')
+
+    def test_if_none_match(self):
+        """The same version is a 304, a vote give a new one."""
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_vote(self.choice1, self.user)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total"], 1)
+
+    def test_missing_question(self):
+        """Unknown questions are a 404."""
+        self.assertEqual(self.client.get(reverse("polls:results-json", args=(999,))).status_code, 404)
+
+    def test_version_from_database(self):
+        """A change made by another worker, without touching this cache, gives a new ETag."""
+        etag = self.client.get(self.url)["ETag"]
+        Choice.objects.filter(pk=self.choice1.pk).update(vote_count=5)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total"], 5)
+
+    @override_settings(POLLS_RESULTS_STREAM_INTERVAL=60)
+    def test_watchers_share_one_read(self):
+        """Requests within an interval are answered from one read of the tallies."""
+        results_poller.clear()
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(self.url).json()["total"], 0)
+        results_poller.clear()
+
+    def test_stream_refused_under_wsgi(self):
+        """A WSGI server cannot stream, the stream answers 501."""
+        response = self.client.get(reverse("polls:results-stream", args=(self.question.id,)))
+        self.assertEqual(response.status_code, 501)
+
+    def test_tally_changes(self):
+        """Only choices whose votes changed are sent."""
+        self.assertEqual(tally_changes({"1": 3, "2": 5}, {"1": 3, "2": 6, "3": 0}), {"2": 6, "3": 0})
+
+    @override_settings(POLLS_RESULTS_STREAM_SECONDS=0)
+    async def test_stream_start_with_results(self):
+        """The stream open with the current results."""
+        response = await self.async_client.get(
+            reverse("polls:results-stream", args=(self.question.id,)))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        content = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(content.startswith("event: results\n"))
+        self.assertIn('"total": 0', content)
+
+
+@override_settings(POLLS_SERVER_TIMING=True)
+class RequestTimingTests(TestCase):
+    """Test the request timing middleware."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create a published question."""
+        cls.question = create_question("Question", days=-1)
+
+    def setUp(self):
+        """Start with no request samples and no cached pages."""
+        request_metrics.reset()
+        results_cache().clear()
+
+    def test_server_timing_header(self):
+        """Responses carry database, template and total time."""
+        response = self.client.get(reverse("polls:index"))
+        self.assertRegex(response["Server-Timing"],
+                         r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_stats_endpoint(self):
+        """Staff see per view samples of this process."""
+        self.client.get(reverse("polls:index"))
+        staff = User.objects.create_user(username='staff', password='testpassword', is_staff=True)
+        self.client.force_login(staff)
+        stats = self.client.get(reverse("polls:stats")).json()
+        index = stats["requests"]["polls:index"]
+        self.assertEqual(index["requests"], 1)
+        self.assertEqual(index["queries_per_request"], 2)
+        self.assertGreater(index["template_ms_per_request"], 0)
+        self.assertEqual(sum(index["histogram"].values()), 1)
+        self.assertIn("depth", stats["vote_queue"])
+
+    def test_slow_request_logged(self):
+        """Requests over the query threshold are logged."""
+        with self.settings(POLLS_SLOW_REQUEST_QUERIES=2):
+            with self.assertLogs("polls.timing", level="WARNING") as logs:
+                self.client.get(reverse("polls:index"))
+        self.assertEqual(logs.records[0].view, "polls:index")
+        self.assertEqual(logs.records[0].queries, 2)
+
+
+class AsyncUrlconf:
+    """Project URLs with the async read views of the polls app."""
+
+    urlpatterns = [
+        path("polls/", include((poll_urlpatterns(use_async=True), "polls"))),
+        *[pattern for pattern in project_urls.urlpatterns if str(pattern.pattern) != "polls/"],
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncUrlconf)
+class AsyncViewTests(TestCase):
+    """Test the async index, detail and results views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Create an open poll with a vote, a closed poll and a user."""
+        cls.question = create_question("Open question", days=-1)
+        cls.choice1 = create_choice(cls.question)
+        cls.choice2 = create_choice(cls.question)
+        cls.closed = create_question("Closed question", days=-5)
+        cls.closed.end_date = timezone.now() - datetime.timedelta(days=1)
+        cls.closed.save()
+        cls.user = User.objects.create_user(username='testuser', password='testpassword')
+        create_vote(cls.choice2, cls.user)
+
+    def setUp(self):
+        """Start with an empty cache."""
+        results_cache().clear()
+
+    async def test_index(self):
+        """Anonymous visitors get the cached page, users their own."""
+        response = await self.async_client.get(reverse("polls:index"))
+        self.assertContains(response, "Open question")
+        self.assertContains(response, "Closed question --Poll end!!!")
+        cached = await self.async_client.get(reverse("polls:index"),
+                                             headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(cached.status_code, 304)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("polls:index"))
+        self.assertContains(response, "Welcome back, testuser")
+
+    async def test_detail_check_previous_vote(self):
+        """The form of an open poll has the user's vote checked."""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("polls:detail", args=(self.question.id,)))
+        self.assertContains(response, f'value="{self.choice2.id}"\n         checked=True')
+
+    async def test_detail_of_closed_poll_redirect(self):
+        """A closed or missing poll goes back to the index."""
+        for question_id in (self.closed.id, 999):
+            response = await self.async_client.get(reverse("polls:detail", args=(question_id,)))
+            self.assertRedirects(response, reverse("polls:index"), fetch_redirect_response=False)
+
+    async def test_results(self):
+        """Results page and JSON show the tallies."""
+        response = await self.async_client.get(reverse("polls:results", args=(self.question.id,)))
+        self.assertContains(response, '<td class="vote-count">1</td>')
+        response = await self.async_client.get(
+            reverse("polls:results-json", args=(self.question.id,)))
+        self.assertEqual(response.json()["total"], 1)
+        response = await self.async_client.get(
+            reverse("polls:results-json", args=(self.question.id,)),
+            headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(reverse("polls:results", args=(999,)))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_vote(self):
+        """The sync vote view works behind the async ones."""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(reverse("polls:vote", args=(self.question.id,)),
+                                                {"choice": self.choice1.id})
+        self.assertRedirects(response, reverse("polls:results", args=(self.question.id,)),
+                             fetch_redirect_response=False)
+        vote = await Vote.objects.aget(user=self.user, question=self.question)
+        self.assertEqual(vote.choice_id, self.choice1.id)
+
+    @override_settings(POLLS_SERVER_TIMING=True)
+    async def test_queries_counted(self):
+        """Queries of async views, run in sync_to_async threads, are measured."""
+        response = await self.async_client.get(reverse("polls:index"))
+        self.assertIn('desc="2 queries"', response["Server-Timing"])
+
+    async def test_async_page_is_sync_page(self):
+        """Paginator pages read with async iteration match the sync ones."""
+        paginator = KeysetPaginator(Question.objects.all(), 1)
+        page = await paginator.apage()
+        self.assertEqual(page.object_list, await sync_to_async(lambda: paginator.page().object_list)())
+        self.assertIsNotNone(page.next_cursor)
+
+
+class LoggingTests(TestCase):
+    """Test JSON formatting, DEBUG sampling and the queue handler."""
+
+    def make_record(self, level=logging.INFO, **extra):
+        """Return a log record with extra fields."""
+        record = logging.makeLogRecord({"name": "polls", "levelno": level,
+                                        "levelname": logging.getLevelName(level),
+                                        "msg": "User %s voted", "args": ("tester",)})
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_formatter(self):
+        """Records become JSON with their extra fields."""
+        line = JsonFormatter().format(self.make_record(event="vote", question_id=3))
+        entry = json.loads(line)
+        self.assertEqual(entry["message"], "User tester voted")
+        self.assertEqual(entry["event"], "vote")
+        self.assertEqual(entry["question_id"], 3)
+
+    def test_sampling_filter(self):
+        """DEBUG records are sampled, INFO records always pass."""
+        drop_debug = SamplingFilter(rate=0.0)
+        self.assertFalse(drop_debug.filter(self.make_record(logging.DEBUG)))
+        self.assertTrue(drop_debug.filter(self.make_record(logging.INFO)))
+        self.assertTrue(SamplingFilter(rate=1.0).filter(self.make_record(logging.DEBUG)))
+
+    def test_queue_handler_forward_records(self):
+        """Records reach the target handler through the listener thread."""
+        stream = StringIO()
+        target = logging.StreamHandler(stream)
+        handler = QueueListenerHandler([target])
+        try:
+            handler.handle(self.make_record())
+        finally:
+            handler.close()
+            target.close()
+        self.assertIn("User tester voted", stream.getvalue())
+
+    def test_queue_handler_target_resolved_by_dict_config(self):
+        """cfg:// references are resolved to handlers configured before the queue handler."""
+        target = logging.NullHandler()
+        configurator = logging.config.DictConfigurator({"handlers": {"target": target}})
+        handler = QueueListenerHandler(configurator.convert(["cfg://handlers.target"]))
+        self.assertEqual(handler.target_handlers, [target])
+        configurator = logging.config.DictConfigurator({"handlers": {"target": {"class": "logging.NullHandler"}}})
+        with self.assertRaisesMessage(ValueError, "not configured yet"):
+            QueueListenerHandler(configurator.convert(["cfg://handlers.target"]))
+
+    def test_queue_handler_drop_when_full(self):
+        """A full queue drop records instead of blocking."""
+        handler = QueueListenerHandler([], queue_size=1)
+        handler.enqueue(self.make_record())
+        handler.enqueue(self.make_record())
+        self.assertEqual(handler.dropped, 1)
@@ -0,0 +1,237 @@
+"""Per-request query count and latency instrumentation.
+
+RequestTimingMiddleware measures the wall time, SQL queries, database
+time and template render time of each request. It adds them to the
+response as a Server-Timing header and keeps the last samples of each
+view in request_metrics. Requests slower than POLLS_SLOW_REQUEST_MS,
+or running more than POLLS_SLOW_REQUEST_QUERIES queries, are logged.
+
+Queries are counted by an execute wrapper installed once on every
+database connection, which adds them to the timing of the current
+request found in a context variable. sync_to_async copies the context
+into its thread, so the queries of async views run there are counted.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+from .metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in milliseconds of the latency histogram buckets.
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+current_timing = contextvars.ContextVar("current_timing", default=None)
+
+
+class RequestTiming:
+    """Counters of the request being handled."""
+
+    def __init__(self):
+        """Start the wall clock of the request."""
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+
+    def elapsed(self):
+        """Return seconds since the request started."""
+        return time.perf_counter() - self.started
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper counting queries and their time."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+
+def timed_execute(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the timing of the current request."""
+    timing = current_timing.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    return timing(execute, sql, params, many, context)
+
+
+def instrument(connection):
+    """Install timed_execute on a database connection, once."""
+    if timed_execute not in connection.execute_wrappers:
+        # first, so execute_wrapper() blocks still remove their own wrapper.
+        connection.execute_wrappers.insert(0, timed_execute)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """Instrument each new database connection, whatever thread opens it."""
+    instrument(connection)
+
+
+class TimedTemplate:
+    """Template of the Django backend that adds its render time to the request."""
+
+    def __init__(self, template):
+        """Wrap a template of the Django backend."""
+        self.template = template
+
+    def __getattr__(self, name):
+        """Give access to the attributes of the wrapped template."""
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        """Render the template and count the time spent."""
+        timing = current_timing.get()
+        if timing is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timing.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Django template backend measuring the render time of each request."""
+
+    def from_string(self, template_code):
+        """Return a timed template compiled from a string."""
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        """Return a timed template loaded by name."""
+        return TimedTemplate(super().get_template(template_name))
+
+
+class RequestMetrics:
+    """Rolling window of the last request samples of each view."""
+
+    def __init__(self, window=1000):
+        """Keep at most window samples per view."""
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, view, seconds, queries, db_seconds, template_seconds):
+        """Record one request of a view."""
+        with self.lock:
+            samples = self.samples.get(view)
+            if samples is None:
+                samples = self.samples[view] = deque(maxlen=self.window)
+            samples.append((seconds * 1000, queries, db_seconds * 1000, template_seconds * 1000))
+
+    def reset(self):
+        """Drop every sample."""
+        with self.lock:
+            self.samples.clear()
+
+    def snapshot(self):
+        """Return latency percentiles, histogram and query averages of each view."""
+        with self.lock:
+            samples = {view: list(values) for view, values in self.samples.items()}
+        return {view: self.summarize(values) for view, values in sorted(samples.items())}
+
+    @staticmethod
+    def summarize(values):
+        """Return the statistics of samples of one view."""
+        latencies = [value[0] for value in values]
+        histogram = [0] * (len(BUCKETS_MS) + 1)
+        for latency in latencies:
+            histogram[bisect.bisect_left(BUCKETS_MS, latency)] += 1
+        labels = [f"<={bound}ms" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        count = len(values)
+        return {
+            "requests": count,
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "queries_per_request": round(sum(value[1] for value in values) / count, 2),
+            "db_ms_per_request": round(sum(value[2] for value in values) / count, 3),
+            "template_ms_per_request": round(sum(value[3] for value in values) / count, 3),
+            "histogram": dict(zip(labels, histogram)),
+        }
+
+
+request_metrics = RequestMetrics(settings.POLLS_METRICS_WINDOW)
+
+
+def view_name(request):
+    """Return the URL name of the view that handled a request."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    return match.view_name or match._func_path
+
+
+class RequestTimingMiddleware:
+    """Measure each request and report it as Server-Timing, metrics and slow logs.
+
+    Runs as sync or async middleware, so async views are not moved to a
+    thread under ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """Keep the next handler, and be a coroutine if it is one."""
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        """Run the request with its timing as the current one."""
+        if self.async_mode:
+            return self.__acall__(request)
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        return self.report(request, response, timing)
+
+    async def __acall__(self, request):
+        """Await the request, counting the queries run in sync_to_async threads."""
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        return self.report(request, response, timing)
+
+    def report(self, request, response, timing):
+        """Record the timing of a finished request and add its Server-Timing header."""
+        seconds = timing.elapsed()
+        view = view_name(request)
+        request_metrics.add(view, seconds, timing.queries, timing.db_seconds,
+                            timing.template_seconds)
+        if settings.POLLS_SERVER_TIMING:
+            response["Server-Timing"] = (
+                f'db;dur={timing.db_seconds * 1000:.2f};desc="{timing.queries} queries", '
+                f"tpl;dur={timing.template_seconds * 1000:.2f}, "
+                f"total;dur={seconds * 1000:.2f}")
+        if (seconds * 1000 >= settings.POLLS_SLOW_REQUEST_MS
+                or timing.queries >= settings.POLLS_SLOW_REQUEST_QUERIES):
+            logger.warning("Slow request %s %s took %.1f ms and %s queries",
+                           request.method, request.path, seconds * 1000, timing.queries,
+                           extra={"event": "slow_request", "view": view,
+                                  "status": response.status_code,
+                                  "duration_ms": round(seconds * 1000, 3),
+                                  "queries": timing.queries,
+                                  "db_ms": round(timing.db_seconds * 1000, 3),
+                                  "template_ms": round(timing.template_seconds * 1000, 3)})
+        return response
@@ -1,12 +1,30 @@
 """Module for urls."""
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, async_views, views
+
+
+def poll_urlpatterns(use_async=False):
+    """Return the poll URLs, with the async read views if use_async is set."""
+    if use_async:
+        index, detail, results, results_json = (
+            async_views.index, async_views.detail, async_views.results, api.aresults_json)
+    else:
+        index, detail, results, results_json = (
+            views.IndexView.as_view(), views.DetailView.as_view(), views.ResultsView.as_view(),
+            api.results_json)
+    return [
+        path("", index, name="index"),
+        path("<int:pk>/", detail, name="detail"),
+        path("<int:pk>/results/", results, name="results"),
+        path("<int:pk>/results.json", results_json, name="results-json"),
+        path("<int:pk>/results/stream/", api.results_stream, name="results-stream"),
+        path("<int:question_id>/vote/", views.vote, name="vote"),
+        path("<int:question_id>/export/", views.export, name="export"),
+        path("stats/", views.stats, name="stats"),
+    ]
+
 
 app_name = "polls"
-urlpatterns = [
-    path("", views.IndexView.as_view(), name="index"),
-    path("<int:pk>/", views.DetailView.as_view(), name="detail"),
-    path("<int:pk>/results/", views.ResultsView.as_view(), name="results"),
-    path("<int:question_id>/vote/", views.vote, name="vote"),
-]
+urlpatterns = poll_urlpatterns(settings.POLLS_ASYNC_VIEWS)
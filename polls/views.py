@@ -1,6 +1,8 @@
 """Module for polls application view."""
 import logging
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login, authenticate
 from django.contrib import messages
 from django.contrib.auth.forms import UserCreationForm
@@ -10,14 +12,31 @@ from django.contrib.auth.signals import (
     user_logged_out,
     user_login_failed
     )
+from django.core.handlers.wsgi import WSGIRequest
+from django.db.models import BooleanField, ExpressionWrapper, Prefetch, Q
 from django.dispatch import receiver
-from django.http import HttpResponseRedirect, Http404
+from django.http import (
+    Http404,
+    HttpResponseBadRequest,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+    )
 from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.views import generic
 
+from .cache import cached_results, page_version, results_cache
+from .export import FORMATS, KINDS, aexport_lines, export_lines
+from .ingest import upsert_votes, vote_buffer
 from .models import Choice, Question, Vote
+from .pagecache import anonymous_page_cache, index_timeout
+from .pagination import KeysetPaginator
+from .results import with_percentages
+from .state import poll_state
+from .timing import request_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -33,19 +52,54 @@ def get_client_ip(request):
     return ip
 
 
+def published_questions():
+    """Return the published questions newest first, with is_open computed in SQL."""
+    now = timezone.now()
+    is_open = Q(end_date__isnull=True) | Q(end_date__gte=now)
+    return (Question.objects.filter(pub_date__lte=now)
+            .annotate(is_open=ExpressionWrapper(is_open, output_field=BooleanField()))
+            .order_by("-pub_date", "-id"))
+
+
+def published_with_choices():
+    """Return the published questions with their choices prefetched in order."""
+    return (Question.objects.filter(pub_date__lte=timezone.now())
+            .prefetch_related(Prefetch("choice_set", queryset=Choice.objects.order_by("id"))))
+
+
+@method_decorator(anonymous_page_cache(lambda kwargs: "index", timeout=index_timeout),
+                  name="dispatch")
 class IndexView(generic.ListView):
     """A generic view for index page.
 
     It show published polls question order by
-    publication date.
+    publication date, one keyset page at a time. Anonymous
+    visitors get the whole page from the cache, logged-in
+    users a cached question list.
     """
 
     template_name = "polls/index.html"
     context_object_name = "latest_question_list"
 
     def get_queryset(self):
-        """Return the published questions."""
-        return Question.objects.filter(pub_date__lte=timezone.now()).order_by("-pub_date")
+        """Return the published questions, with is_open computed in SQL."""
+        return published_questions()
+
+    def get_context_data(self, **kwargs):
+        """Replace the question list with the requested page."""
+        paginator = KeysetPaginator(self.object_list, settings.POLLS_INDEX_PAGE_SIZE)
+        try:
+            page = paginator.page(after=self.request.GET.get("after"),
+                                  before=self.request.GET.get("before"))
+        except ValueError:
+            page = paginator.page()
+        return super().get_context_data(
+            object_list=page.object_list,
+            next_cursor=page.next_cursor,
+            previous_cursor=page.previous_cursor,
+            page_version=page_version("index"),
+            fragment_timeout=index_timeout(),
+            **kwargs)
 
 
 class DetailView(generic.DetailView):
@@ -58,14 +112,14 @@ class DetailView(generic.DetailView):
     template_name = "polls/detail.html"
 
     def get_queryset(self):
-        """Excludes any questions that aren't published yet."""
-        return Question.objects.filter(pub_date__lte=timezone.now())
+        """Excludes any questions that aren't published yet, with choices prefetched."""
+        return published_with_choices()
 
     def get(self, request, *args, **kwargs):
         """Check for poll availability and user previous vote."""
         try:
-            # Use get_object_or_404 to fetch the question or raise 404
-            question = get_object_or_404(Question, pk=kwargs.get('pk'))
+            # Fetch the published question with its choices or raise 404
+            question = self.get_object()
         except Http404:
             # Log the event and show an error message to the user
             messages.error(request, "The poll does not exist.")
@@ -78,10 +132,15 @@ class DetailView(generic.DetailView):
             logger.warning("Attempted to access a closed poll.")
             return redirect('polls:index')
 
-        # Check for User vote on this question.
+        # Check for User vote on this question, a buffered vote not
+        # written yet comes first.
         user_vote = None
         if request.user.is_authenticated:
-            user_vote = Vote.objects.filter(user=request.user, choice__question=question).first()
+            pending_choice_id = vote_buffer.pending_choice(request.user.id, question.id)
+            if pending_choice_id is not None:
+                user_vote = Vote(user=request.user, question=question, choice_id=pending_choice_id)
+            else:
+                user_vote = Vote.objects.filter(user=request.user, question=question).first()
 
         return render(request, self.template_name, {
             'question': question,
@@ -89,12 +148,48 @@ class DetailView(generic.DetailView):
         })
 
 
-class ResultsView(generic.DetailView):
-    """A view containing logic for results page."""
+@method_decorator(anonymous_page_cache(lambda kwargs: f"results:{kwargs['pk']}"),
+                  name="dispatch")
+class ResultsView(generic.TemplateView):
+    """A view containing logic for results page.
+
+    Question, choices and their vote totals come from the results cache,
+    or from one query on a miss. The total and percentages are computed
+    once here. Like the index, the page is cached for anonymous visitors
+    and the results table for logged-in users.
+    """
 
-    model = Question
     template_name = "polls/results.html"
 
+    def get_context_data(self, **kwargs):
+        """Add the question results to the context."""
+        context = super().get_context_data(**kwargs)
+        try:
+            results = cached_results(kwargs["pk"])
+        except Question.DoesNotExist:
+            raise Http404("No Question matches the given query.")
+        context.update({
+            "question": results,
+            "choices": with_percentages(results),
+            "total_votes": results["total"],
+            "page_version": page_version(f"results:{kwargs['pk']}"),
+            "fragment_timeout": results_cache().default_timeout,
+        })
+        return context
+
+
+def get_selected_choice_id(request, state):
+    """Return the posted choice id if it is a choice of the poll, or None.
+
+    Args:
+        state : PollState of the voted question
+    """
+    try:
+        choice_id = int(request.POST["choice"])
+    except (KeyError, ValueError):
+        return None
+    return choice_id if choice_id in state.choices else None
+
 
 @login_required
 def vote(request, question_id):
@@ -102,13 +197,19 @@ def vote(request, question_id):
 
     If the question can not be vote, interaction will return
     user to index page. If poll is available, user can vote
-    on poll's choice and submit it.
+    on poll's choice and submit it. The question and choice are
+    checked against the cached poll state, without reading the
+    database.
 
     Args:
         question_id : integer id of polls question
     """
     this_user = request.user
-    question = get_object_or_404(Question, pk=question_id)
+    try:
+        state = poll_state(question_id)
+    except Question.DoesNotExist:
+        raise Http404("No Question matches the given query.")
+    choice_id = get_selected_choice_id(request, state)
 
     user_ip = get_client_ip(request)
 
@@ -116,18 +217,18 @@ def vote(request, question_id):
                 this_user.username,
                 this_user.first_name,
                 this_user.last_name, user_ip,
-                question_id)
+                question_id,
+                extra={"event": "vote", "user_id": this_user.id,
+                       "question_id": question_id, "ip": user_ip})
 
-    if not question.can_vote():
+    if not state.can_vote():
         # prevent voting on end question
         logger.warning("User %s tried to vote on a closed poll %s",
                        this_user.username,
                        question_id)
 
         return HttpResponseRedirect(reverse("polls:index"))
-    try:
-        selected_choice = question.choice_set.get(pk=request.POST["choice"])
-    except (KeyError, Choice.DoesNotExist):
+    if choice_id is None:
         # Redisplay the question voting form.
         logger.warning("User %s failed to select a valid choice for question %s",
                        this_user.username,
@@ -137,33 +238,86 @@ def vote(request, question_id):
             request,
             "polls/detail.html",
             {
-                "question": question,
+                "question": get_object_or_404(Question, pk=question_id),
                 "error_message": "You didn't select a choice."
             },
         )
+    choice_text = state.choices[choice_id]
 
-    try:
-        # find a vote of this user for this question.
-        vote = Vote.objects.get(user=this_user, choice__question=question)
-        vote.choice = selected_choice
-        # save change to new vote or existing vote.
+    if (settings.POLLS_VOTE_INGESTION == "buffered"
+            and vote_buffer.submit(this_user.id, question_id, choice_id)):
         messages.success(request,
-                         f'Your Vote for "{question.question_text}" have been updated to "{selected_choice.choice_text}".')
-        logger.info("User %s changed their vote for question %s to '%s'",
-                    this_user.username, question_id, selected_choice.choice_text)
-
-    except Vote.DoesNotExist:
-        vote = Vote(user=this_user, choice=selected_choice)
+                         f"Your vote for '{choice_text}' has been received.")
+        logger.info("User %s vote for question %s is buffered",
+                    this_user.username, question_id,
+                    extra={"event": "vote_buffered", "user_id": this_user.id,
+                           "question_id": question_id, "choice_id": choice_id})
+        return HttpResponseRedirect(reverse("polls:results", args=(question_id,)))
+
+    # create or change the vote of this user for this question with one
+    # upsert, the unique (user, question) constraint prevent duplicate
+    # votes.
+    previous = upsert_votes([(this_user.id, question_id, choice_id)])
+
+    if not previous:
         messages.success(request,
-                         f"Vote for '{selected_choice.choice_text}' success.")
+                         f"Vote for '{choice_text}' success.")
         logger.info("User have vote for %s",
-                    selected_choice.choice_text)
-    vote.save()
+                    choice_text,
+                    extra={"event": "vote_created", "user_id": this_user.id,
+                           "question_id": question_id, "choice_id": choice_id})
+    else:
+        messages.success(request,
+                         f'Your Vote for "{state.question_text}" have been updated to "{choice_text}".')
+        logger.info("User %s changed their vote for question %s to '%s'",
+                    this_user.username, question_id, choice_text,
+                    extra={"event": "vote_changed", "user_id": this_user.id,
+                           "question_id": question_id, "choice_id": choice_id})
 
     # Always return an HttpResponseRedirect after successfully dealing
     # with POST data. This prevents data from being posted twice if a
     # user hits the Back button.
-    return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
+    return HttpResponseRedirect(reverse("polls:results", args=(question_id,)))
+
+
+@staff_member_required
+def export(request, question_id):
+    """Stream results or raw votes of a question as CSV or NDJSON.
+
+    Query parameters "kind" (results or votes) and "format" (csv or
+    ndjson) choose what is exported, rows are streamed as they are read,
+    from an async iterator under ASGI.
+
+    Args:
+        question_id : integer id of polls question
+    """
+    question = get_object_or_404(Question, pk=question_id)
+    kind = request.GET.get("kind", "results")
+    export_format = request.GET.get("format", "csv")
+    if kind not in KINDS or export_format not in FORMATS:
+        return HttpResponseBadRequest("Unknown export kind or format.")
+    logger.info("User %s exported %s of question %s as %s",
+                request.user.username, kind, question.id, export_format)
+    lines = export_lines(question.id, kind, export_format)
+    if not isinstance(request, WSGIRequest):
+        # an ASGI server reads the lines from the event loop.
+        lines = aexport_lines(lines)
+    response = StreamingHttpResponse(lines, content_type=FORMATS[export_format])
+    filename = f"question-{question.id}-{kind}.{export_format}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+@staff_member_required
+def stats(request):
+    """Return vote queue and request metrics of this process as JSON.
+
+    "?reset=1" clears the request samples after reading them.
+    """
+    metrics = request_metrics.snapshot()
+    if request.GET.get("reset"):
+        request_metrics.reset()
+    return JsonResponse({"vote_queue": vote_buffer.stats(), "requests": metrics})
 
 
 def signup(request):
@@ -196,7 +350,8 @@ def log_login_event(sender, request, user, **kwargs):
         user: User object
     """
     user_ip = get_client_ip(request)
-    logger.info(f"User {user} logged in from {user_ip}")
+    logger.info("User %s logged in from %s", user, user_ip,
+                extra={"event": "login", "user_id": user.id, "ip": user_ip})
 
 
 @receiver(user_logged_out)
@@ -210,7 +365,8 @@ def log_logged_out_event(sender, request, user, **kwargs):
         user: User object
     """
     user_ip = get_client_ip(request)
-    logger.info(f"User {user.username} logged out from {user_ip}")
+    logger.info("User %s logged out from %s", user.username, user_ip,
+                extra={"event": "logout", "user_id": user.id, "ip": user_ip})
 
 
 @receiver(user_login_failed)
@@ -226,4 +382,5 @@ def log_login_failed_event(sender, credentials, request, **kwargs):
     """
     user_ip = get_client_ip(request)
     username = credentials.get('username', 'unknown')
-    logger.warning(f"Failed login attempt for {username} from {user_ip}")
+    logger.warning("Failed login attempt for %s from %s", username, user_ip,
+                   extra={"event": "login_failed", "username": username, "ip": user_ip})